@@ -6,7 +6,11 @@ Contains the Category Class for NodeBB Client
 
 from openedx.features.openedx_edly_discussion.client import Client
 from openedx.features.openedx_edly_discussion.client.constants import DEFAULT_GROUPS, DEFAULT_PRIVILEGES
-from openedx.features.openedx_edly_discussion.client.utils import save_category_relation_into_db
+from openedx.features.openedx_edly_discussion.client.utils import (
+    CourseMapping,
+    get_course_ids_from_category_ids,
+    save_category_relation_into_db
+)
 
 
 class NodeBBCategory(Client):
@@ -26,17 +30,54 @@ class NodeBBCategory(Client):
                 name: "course_name"
             }
 
+        The create is idempotent: the category of a course which is mapped already is not created again,
+        and a category which NodeBB may have created although the call failed on the way back is adopted.
+        As category names are not unique, the newest category with the name which no other course is mapped
+        to is adopted, and only if no other course maps it meanwhile.
+
         Returns:
             tuple: Tuple in the form (response_code, json_response) received from requests call.
 
         """
+        course_mapping = CourseMapping.load(course_id=course_id)
+        if course_mapping and course_mapping.cid:
+            return 200, {'cid': course_mapping.cid}
+
         response_code, json_response = self.post('/api/v2/categories', **payload)
 
         if response_code == 200:
             save_category_relation_into_db(course_id=course_id, category_id=json_response['cid'])
+        elif self.may_have_reached_nodebb(response_code):
+            category_id = self.find_unmapped_category(payload.get('name'))
+            if category_id is not None and save_category_relation_into_db(course_id=course_id, category_id=category_id):
+                return 200, {'cid': category_id}
 
         return response_code, json_response
 
+    def find_unmapped_category(self, name):
+        """
+        Looks up the newest NodeBB Category with the given name which is not mapped to any edX course.
+
+        The categories are revalidated with their ETag rather than fetched again when nothing changed, and
+        the lookup is not sent at all while the circuit to NodeBB is open.
+
+        Args:
+            name (str): Name of the category.
+
+        Returns:
+            int: cid of the category, None if there is none.
+        """
+        response_code, json_response = self.get_categories(use_cache=False)
+        if response_code != 200:
+            return None
+
+        category_ids = [
+            category['cid'] for category in json_response.get('categories', []) if category.get('name') == name
+        ]
+        mapped_category_ids = get_course_ids_from_category_ids(category_ids)
+        unmapped_category_ids = [category_id for category_id in category_ids if category_id not in mapped_category_ids]
+        return max(unmapped_category_ids) if unmapped_category_ids else None
+
     def delete_default_permissions(self, category_id):
         """
         By default whenever a new category is created in NodeBB, the default groups have some default privileges
@@ -54,7 +95,11 @@ class NodeBBCategory(Client):
             'groups': DEFAULT_GROUPS
         }
 
-        return self.delete('/api/v2/categories/{}/privileges'.format(category_id), **payload)
+        response_code, json_response = self.delete('/api/v2/categories/{}/privileges'.format(category_id), **payload)
+        if response_code == 200:
+            self.forget('/api/category/{}'.format(category_id))
+
+        return response_code, json_response
 
     def add_course_group_permission(self, category_id, group_name):
         """
@@ -73,7 +118,11 @@ class NodeBBCategory(Client):
                 group_name
             ]
         }
-        return self.put('/api/v2/categories/{}/privileges'.format(category_id), **payload)
+        response_code, json_response = self.put('/api/v2/categories/{}/privileges'.format(category_id), **payload)
+        if response_code == 200:
+            self.forget('/api/category/{}'.format(category_id))
+
+        return response_code, json_response
 
     def delete_category(self, category_id):
         """
@@ -85,4 +134,33 @@ class NodeBBCategory(Client):
         Returns:
             tuple: Tuple in the form (response_code, json_response) received from requests call.
         """
-        return self.delete('/api/v2/categories/{}'.format(category_id))
+        response_code, json_response = self.delete('/api/v2/categories/{}'.format(category_id))
+        if response_code == 200:
+            self.forget('/api/category/{}'.format(category_id))
+
+        return response_code, json_response
+
+    def get_categories(self, use_cache=True):
+        """
+        Fetches the NodeBB Categories from the read api.
+
+        Args:
+            use_cache (bool): Set to False to skip the read cache.
+
+        Returns:
+            tuple: Tuple in the form (response_code, json_response) received from requests call.
+        """
+        return self.get('/api/categories', use_cache=use_cache)
+
+    def get_category(self, category_id, use_cache=True):
+        """
+        Fetches a NodeBB Category from the read api.
+
+        Args:
+            category_id (int): Category to fetch.
+            use_cache (bool): Set to False to skip the read cache.
+
+        Returns:
+            tuple: Tuple in the form (response_code, json_response) received from requests call.
+        """
+        return self.get('/api/category/{}'.format(category_id), use_cache=use_cache)
@@ -0,0 +1,97 @@
+"""
+Circuit breaker for the NodeBB client, its state is kept in the Django cache so that it is shared by all workers.
+"""
+import time
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from openedx.features.openedx_edly_discussion.client.constants import (
+    DEFAULT_CACHE_ALIAS,
+    DEFAULT_CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    DEFAULT_CIRCUIT_BREAKER_FAILURE_WINDOW,
+    DEFAULT_CIRCUIT_BREAKER_RECOVERY_TIMEOUT
+)
+
+FAILURES_KEY = 'edly_discussion:circuit:failures'
+OPENED_AT_KEY = 'edly_discussion:circuit:opened_at'
+PROBE_KEY = 'edly_discussion:circuit:probe'
+
+
+class CircuitBreaker(object):
+    """
+    Opens once too many calls fail within a time window and fails calls fast until NodeBB recovers.
+
+    closed: calls go through and failures are counted within a time window.
+    open: calls are refused until the recovery timeout has passed.
+    half-open: a single probe call is let through, its result closes or re-opens the circuit.
+    """
+
+    def __init__(self):
+        edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+        self.cache = caches[edly_settings.get('CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+        self.failure_threshold = edly_settings.get(
+            'CIRCUIT_BREAKER_FAILURE_THRESHOLD', DEFAULT_CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        )
+        self.failure_window = edly_settings.get(
+            'CIRCUIT_BREAKER_FAILURE_WINDOW', DEFAULT_CIRCUIT_BREAKER_FAILURE_WINDOW
+        )
+        self.recovery_timeout = edly_settings.get(
+            'CIRCUIT_BREAKER_RECOVERY_TIMEOUT', DEFAULT_CIRCUIT_BREAKER_RECOVERY_TIMEOUT
+        )
+
+    def allow_request(self):
+        """
+        Checks whether a call may be sent to NodeBB.
+
+        Returns:
+            bool: True if the circuit is closed or if this call is the half-open probe.
+        """
+        opened_at = self.cache.get(OPENED_AT_KEY)
+        if opened_at is None:
+            return True
+
+        if time.time() - opened_at < self.recovery_timeout:
+            return False
+
+        return self.cache.add(PROBE_KEY, True, self.recovery_timeout)
+
+    def release_probe(self):
+        """
+        Gives the half-open probe back when the call let through was not sent or told nothing about the health
+        of NodeBB, so that the next call probes instead of every call waiting for the probe to expire.
+        """
+        if self.cache.get(OPENED_AT_KEY) is not None:
+            self.cache.delete(PROBE_KEY)
+
+    def record_success(self):
+        """
+        Closes the circuit and forgets previous failures.
+        """
+        if self.cache.get_many([FAILURES_KEY, OPENED_AT_KEY]):
+            self.cache.delete_many([FAILURES_KEY, OPENED_AT_KEY, PROBE_KEY])
+
+    def record_failure(self):
+        """
+        Counts a failure and opens the circuit once the threshold is reached or the probe failed.
+        """
+        self.cache.add(FAILURES_KEY, 0, self.failure_window)
+        try:
+            failures = self.cache.incr(FAILURES_KEY)
+        except ValueError:
+            failures = 1
+
+        if failures >= self.failure_threshold or self.cache.get(OPENED_AT_KEY) is not None:
+            self.cache.set(OPENED_AT_KEY, time.time(), None)
+            self.cache.delete(PROBE_KEY)
+
+    def retry_after(self):
+        """
+        Returns:
+            float: Seconds after which a parked call should be tried again, 0 if the circuit is closed.
+        """
+        opened_at = self.cache.get(OPENED_AT_KEY)
+        if opened_at is None:
+            return 0
+
+        remaining = opened_at + self.recovery_timeout - time.time()
+        return remaining if remaining > 0 else self.recovery_timeout
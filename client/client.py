@@ -1,67 +1,469 @@
 """
 Base class which contains the basic methods to interaction with the write api of NodeBB.
 """
+import hashlib
 import json
+import os
+import threading
+import time
 import urlparse
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from django.conf import settings as django_settings
-from openedx.features.openedx_edly_discussion.client.constants import BAD_REQUEST, CONNECTION_ERROR, NODEBB_ADMIN_UID
+from django.core.cache import caches
+from openedx.features.openedx_edly_discussion.client.circuit_breaker import CircuitBreaker
+from openedx.features.openedx_edly_discussion.client.constants import (
+    BAD_REQUEST,
+    CIRCUIT_OPEN,
+    CONFLICT,
+    CONNECTION_ERROR,
+    DEFAULT_CACHE_ALIAS,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_READ_CACHE_ETAG_TTL,
+    DEFAULT_READ_CACHE_TTL,
+    DEFAULT_READ_TIMEOUT,
+    LIVE_PRIORITY,
+    NODEBB_ADMIN_UID,
+    TIMEOUT_ERROR,
+    TOO_MANY_REQUESTS
+)
+from openedx.features.openedx_edly_discussion.client.lanes import Lane
+from openedx.features.openedx_edly_discussion.client.metrics import get_endpoint_template, get_metrics_sink
+from openedx.features.openedx_edly_discussion.client.rate_limiter import RateLimiter
+
+READ_CACHE_KEY = 'edly_discussion:read:{}'
+ENDPOINT_CLASS_ALIASES = {
+    'user': 'users',
+    'category': 'categories',
+}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_thread_pools = {}
+_thread_pools_pid = None
+_thread_pools_lock = threading.Lock()
+
+
+def _build_session():
+    """
+    Builds a keep-alive session whose connection pool is sized from EDLY_DISCUSSION_SETTINGS.
+
+    Returns:
+        requests.Session: Session with an HTTPAdapter mounted for http and https.
+    """
+    edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+    adapter = HTTPAdapter(
+        pool_connections=edly_settings.get('CLIENT_POOL_CONNECTIONS', DEFAULT_POOL_CONNECTIONS),
+        pool_maxsize=edly_settings.get('CLIENT_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE),
+        pool_block=edly_settings.get('CLIENT_POOL_BLOCK', False)
+    )
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not edly_settings.get('CLIENT_KEEP_ALIVE', True):
+        session.headers['Connection'] = 'close'
+
+    return session
+
+
+def get_session():
+    """
+    Returns the session shared by every Client of the current process.
+
+    The session is rebuilt whenever the process id changes, so Celery prefork children never
+    reuse sockets inherited from their parent. Thread workers share the same pool, which is
+    thread safe as long as pool_maxsize covers the number of threads.
+
+    Returns:
+        requests.Session: Pooled session for the current process.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+
+    return _session
+
+
+def reset_session():
+    """
+    Closes the pooled connections of the current process, the next call opens a fresh pool.
+    """
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is not None and _session_pid == os.getpid():
+            _session.close()
+        _session, _session_pid = None, None
+
+
+def get_thread_pool(size):
+    """
+    Returns the thread pool of the given size shared by every Client of the current process.
+
+    Like the session, the pools are rebuilt whenever the process id changes, as the threads of a pool
+    do not survive a fork.
+
+    Args:
+        size (int): Number of threads of the pool.
+
+    Returns:
+        ThreadPool: Pool of the current process.
+    """
+    global _thread_pools, _thread_pools_pid
+
+    pid = os.getpid()
+    with _thread_pools_lock:
+        if _thread_pools_pid != pid:
+            _thread_pools, _thread_pools_pid = {}, pid
+        if size not in _thread_pools:
+            _thread_pools[size] = ThreadPool(size)
+
+        return _thread_pools[size]
+
+
+def get_endpoint_class(path):
+    """
+    Extracts the class of an endpoint, which is the resource right after the api prefix.
+
+    Args:
+        path (str): Api path like /api/v2/groups/{slug}/membership/{uid} or /api/user/username/{username}
+
+    Returns:
+        str: Endpoint class like users, groups or categories, read api singulars are mapped to them.
+    """
+    segments = [segment for segment in path.split('/') if segment]
+    if segments[:1] == ['api']:
+        segments = segments[2:] if segments[1:2] == ['v2'] else segments[1:]
+
+    endpoint_class = segments[0] if segments else ''
+    return ENDPOINT_CLASS_ALIASES.get(endpoint_class, endpoint_class)
+
+
+def get_read_cache_key(path, params):
+    """
+    Args:
+        path (str): Api path of a GET call
+        params (dictionary): Query parameters of the GET call
+
+    Returns:
+        str: Cache key of the call, hashed to stay within the key limits of memcached.
+    """
+    call = json.dumps([path, params], sort_keys=True).encode('utf-8')
+    return READ_CACHE_KEY.format(hashlib.md5(call).hexdigest())
 
 
 class Client(object):
     """
     Client Class responsible to make connection with NodeBB and perform all calls.
+
+    http_time adds up the seconds the calls of the client spent waiting for NodeBB, calls made by call_many
+    from several threads included.
     """
 
-    def __init__(self):
+    def __init__(self, priority=LIVE_PRIORITY, deadline=None):
+        """
+        Args:
+            priority (str): LIVE_PRIORITY for work triggered by users or BULK_PRIORITY for syncs and
+                backfills, bulk calls only get a share of the rate limit and the slots of their lane.
+            deadline (float): Timestamp by which every call of this client must be finished, usually
+                derived from the soft time limit of the calling task.
+        """
+        self.priority = priority
+        self.deadline = deadline
+        self.http_time = 0
+        self._http_time_lock = threading.Lock()
         self._configure()
 
     def _configure(self):
-        self.endpoint = django_settings.EDLY_DISCUSSION_SETTINGS['URL']
+        edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+        self.endpoint = edly_settings['URL']
         self.admin_uid = NODEBB_ADMIN_UID
+        self.circuit_breaker = CircuitBreaker()
+        self.rate_limiter = RateLimiter()
+        self.lane = Lane(self.priority)
+        self.metrics = get_metrics_sink()
+        self.read_cache = caches[edly_settings.get('CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+        self.read_cache_ttl = edly_settings.get('READ_CACHE_TTL', DEFAULT_READ_CACHE_TTL)
+        self.read_cache_etag_ttl = edly_settings.get('READ_CACHE_ETAG_TTL', DEFAULT_READ_CACHE_ETAG_TTL)
         self.headers = {
             'Authorization': 'Bearer {}'.format(django_settings.EDLY_DISCUSSION_SECRETS['API_MASTER_TOKEN']),
             'Content-Type': 'application/json'
         }
 
-    def _call(self, method, path, **kwargs):
+    def _get_timeout(self, endpoint_class):
         """
-        Hidden Method of Client this function will generate all of the Api Call's and return response.
+        Looks up the (connect, read) timeout of an endpoint class and fits it within the deadline.
 
         Args:
-            method (str): Api call method can be Post, Put, and Delete
+            endpoint_class (str): Class of the endpoint being called like users, groups or categories.
+
+        Returns:
+            tuple: Tuple in the form (connect_timeout, read_timeout), None if the deadline has passed.
+        """
+        timeouts = django_settings.EDLY_DISCUSSION_SETTINGS.get('CLIENT_TIMEOUTS') or {}
+        connect_timeout, read_timeout = timeouts.get(
+            endpoint_class, timeouts.get('default', (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT))
+        )
+
+        if self.deadline is not None:
+            remaining = self.deadline - time.time()
+            if remaining <= 0:
+                return None
+            connect_timeout, read_timeout = min(connect_timeout, remaining), min(read_timeout, remaining)
+
+        return connect_timeout, read_timeout
+
+    def _request(self, method, path, payload, headers=None):
+        """
+        Sends a single call to NodeBB and records its latency, status and size if metrics are enabled.
+
+        Args:
+            method (str): Api call method can be Get, Post, Put, and Delete
             path (str): Api path to make call
-            kwargs (dictionary): All other necessary data to make POST, PUT or DELETE calls to API
+            payload (dictionary): Data of the call, sent as query parameters for GET calls.
+            headers (dictionary): Headers to send along with the default ones.
 
         Returns:
-            tuple: Tuple in the form (response_code, json_response) received from requests call.
+            tuple: Tuple in the form (response_code, json_response, response_headers).
+        """
+        if self.metrics is None:
+            return self._send(method, path, payload, headers)
+
+        started = time.time()
+        status_code, response_msg, response_headers = self._send(method, path, payload, headers)
+        elapsed = (time.time() - started) * 1000
+
+        tags = {'endpoint': get_endpoint_template(path), 'method': method}
+        self.metrics.timing('nodebb.request.latency', elapsed, tags)
+        self.metrics.increment('nodebb.request.status', tags=dict(tags, status=status_code))
+        self.metrics.increment('nodebb.request.bytes_sent', len(json.dumps(payload)) if method != 'GET' else 0, tags)
+        self.metrics.increment(
+            'nodebb.request.bytes_received', int(response_headers.get('Content-Length') or 0), tags
+        )
+
+        return status_code, response_msg, response_headers
+
+    def _send(self, method, path, payload, headers=None):
+        """
+        Sends a single call to NodeBB through the circuit breaker, rate limiter, lane cap and timeouts.
+
+        Args:
+            method (str): Api call method can be Get, Post, Put, and Delete
+            path (str): Api path to make call
+            payload (dictionary): Data of the call, sent as query parameters for GET calls.
+            headers (dictionary): Headers to send along with the default ones.
+
+        Returns:
+            tuple: Tuple in the form (response_code, json_response, response_headers).
         """
-        if '_uid' not in kwargs:
-            kwargs.update({'_uid': self.admin_uid})
+        if '_uid' not in payload:
+            payload.update({'_uid': self.admin_uid})
+
+        if not self.circuit_breaker.allow_request():
+            return CIRCUIT_OPEN, 'Circuit to NodeBB is open, call was not sent.', {}
+
+        endpoint_class = get_endpoint_class(path)
+        if not self.rate_limiter.acquire(endpoint_class, self.priority, self.deadline):
+            self.circuit_breaker.release_probe()
+            return TOO_MANY_REQUESTS, 'Rate limit of NodeBB {} calls is reached, call was not sent.'.format(
+                endpoint_class
+            ), {}
+
+        timeout = self._get_timeout(endpoint_class)
+        if timeout is None:
+            self.circuit_breaker.release_probe()
+            return TIMEOUT_ERROR, 'Deadline of the call has passed, call was not sent.', {}
+
+        lane_slot = self.lane.acquire(sum(timeout), self.deadline)
+        if lane_slot is None:
+            self.circuit_breaker.release_probe()
+            return TOO_MANY_REQUESTS, 'All slots of the {} lane are in use, call was not sent.'.format(
+                self.priority
+            ), {}
 
+        request_kwargs = {'params': payload} if method == 'GET' else {'data': json.dumps(payload)}
+        response_headers = {}
+        request_started = time.time()
         try:
-            response = requests.request(
+            response = get_session().request(
                 method,
                 urlparse.urljoin(self.endpoint, path),
-                headers=self.headers,
-                data=json.dumps(kwargs)
+                headers=dict(self.headers, **headers) if headers else self.headers,
+                timeout=timeout,
+                **request_kwargs
             )
-            status_code, response_msg = response.status_code, response.json()
+            status_code, response_headers = response.status_code, response.headers
+            if status_code == TOO_MANY_REQUESTS:
+                self.rate_limiter.backoff(endpoint_class, response_headers.get('Retry-After'))
+
             try:
-                if 'payload' in response_msg:
-                    response_msg = response_msg['payload']
+                response_msg = response.json()
             except ValueError:
                 response_msg = {}
 
+            if isinstance(response_msg, dict) and 'payload' in response_msg:
+                response_msg = response_msg['payload']
+
+        except requests.exceptions.Timeout as err:
+            status_code, response_msg = TIMEOUT_ERROR, err
         except requests.exceptions.ConnectionError as err:
             status_code, response_msg = CONNECTION_ERROR, err
         except requests.exceptions.RequestException as err:
             status_code, response_msg = BAD_REQUEST, err
+        finally:
+            with self._http_time_lock:
+                self.http_time += time.time() - request_started
+            self.lane.release(lane_slot)
+
+        # A 429 of NodeBB neither proves that it recovered nor that it is down.
+        if status_code >= 500:
+            self.circuit_breaker.record_failure()
+        elif status_code == TOO_MANY_REQUESTS:
+            self.circuit_breaker.release_probe()
+        else:
+            self.circuit_breaker.record_success()
+
+        return status_code, response_msg, response_headers
+
+    def _call(self, method, path, **kwargs):
+        """
+        Hidden Method of Client this function will generate all of the Api Call's and return response.
+
+        Args:
+            method (str): Api call method can be Post, Put, and Delete
+            path (str): Api path to make call
+            kwargs (dictionary): All other necessary data to make POST, PUT or DELETE calls to API
+
+        Returns:
+            tuple: Tuple in the form (response_code, json_response) received from requests call.
+        """
+        status_code, response_msg, _ = self._request(method, path, kwargs)
+        return status_code, response_msg
+
+    def _call_operation(self, operation):
+        method, path, payload = operation
+        status_code, response_msg = self._call(method, path, **(payload or {}))
+        return operation, status_code, response_msg
+
+    def call_many(self, operations, max_in_flight=None):
+        """
+        Runs many Api calls concurrently and yields their results as they finish.
+
+        Operations are taken from the iterable max_in_flight at a time, so a generator is not read ahead of
+        the calls, and run on a thread pool shared by the clients of the process.
+
+        Args:
+            operations (iterable): Tuples in the form (method, path, payload) where payload is a
+                dictionary of the data to send or None.
+            max_in_flight (int): Maximum number of calls running at the same time, defaults to
+                CLIENT_MAX_IN_FLIGHT of EDLY_DISCUSSION_SETTINGS.
+
+        Yields:
+            tuple: Tuple in the form (operation, response_code, json_response) in completion order.
+        """
+        if max_in_flight is None:
+            max_in_flight = django_settings.EDLY_DISCUSSION_SETTINGS.get('CLIENT_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT)
+
+        pool = get_thread_pool(max_in_flight)
+        operations = iter(operations)
+        window = list(islice(operations, max_in_flight))
+        while window:
+            for result in pool.imap_unordered(self._call_operation, window):
+                yield result
+            window = list(islice(operations, max_in_flight))
+
+    @staticmethod
+    def may_exist_already(status_code):
+        """
+        Tells whether the object of a failed create call may exist on NodeBB anyway, so that it should be looked
+        up before the create is retried.
+
+        Args:
+            status_code (int): Status code of the create call.
+
+        Returns:
+            bool: True if the call conflicted with an existing object, NodeBB answers conflicts with a 400, or
+                if it failed after it may have reached NodeBB.
+        """
+        if status_code in (BAD_REQUEST, CONFLICT):
+            return True
+
+        return Client.may_have_reached_nodebb(status_code)
+
+    @staticmethod
+    def may_have_reached_nodebb(status_code):
+        """
+        Tells whether a failed call may have been applied by NodeBB anyway, i.e. whether its failure is ambiguous.
+
+        Args:
+            status_code (int): Status code of the call.
+
+        Returns:
+            bool: True if the call failed on the NodeBB side or timed out, after it may have reached NodeBB.
+        """
+        return status_code >= 500 and status_code != CIRCUIT_OPEN
+
+    def get(self, path, use_cache=True, **kwargs):
+        """
+        Sends a GET request to NodeBB, answering from the read cache while the entry is fresh.
+
+        Stale entries are revalidated with If-None-Match, so an unchanged resource costs a 304
+        instead of its full payload.
+
+        Args:
+            path (str): Api path to make call
+            use_cache (bool): Set to False to always ask NodeBB, the answer still refreshes the cache.
+            kwargs (dictionary): Query parameters of the call
+
+        Returns:
+            tuple: Tuple in the form (response_code, json_response) received from requests call.
+        """
+        cache_key = get_read_cache_key(path, kwargs)
+        entry = self.read_cache.get(cache_key)
+        now = time.time()
+        if entry and use_cache and now - entry['fetched_at'] < self.read_cache_ttl:
+            return 200, entry['body']
+
+        headers = {'If-None-Match': entry['etag']} if entry and entry['etag'] else None
+        status_code, response_msg, response_headers = self._request('GET', path, kwargs, headers)
+
+        if status_code == 304 and entry:
+            status_code, response_msg = 200, entry['body']
+            entry['fetched_at'] = now
+            self.read_cache.set(cache_key, entry, self.read_cache_etag_ttl)
+        elif status_code == 200:
+            entry = {'etag': response_headers.get('ETag'), 'body': response_msg, 'fetched_at': now}
+            self.read_cache.set(cache_key, entry, self.read_cache_etag_ttl)
+        elif status_code == 404:
+            self.read_cache.delete(cache_key)
 
         return status_code, response_msg
 
+    def forget(self, path, **kwargs):
+        """
+        Drops the read cache entry of a path, used after a write changes the resource.
+
+        Args:
+            path (str): Api path of the cached GET call
+            kwargs (dictionary): Query parameters of the cached GET call
+        """
+        self.read_cache.delete(get_read_cache_key(path, kwargs))
+
     def post(self, path, **kwargs):
         """
         Sends a POST request to NodeBB.
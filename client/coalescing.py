@@ -0,0 +1,64 @@
+"""
+Coalesces membership changes of a user in a course, the latest desired state is kept in the Django cache
+so that it is shared by all workers.
+"""
+import uuid
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from openedx.features.openedx_edly_discussion.client.constants import (
+    DEFAULT_CACHE_ALIAS,
+    DEFAULT_MEMBERSHIP_COALESCE_TTL,
+    DEFAULT_MEMBERSHIP_COALESCE_WINDOW
+)
+
+MEMBERSHIP_KEY = 'edly_discussion:membership:{}:{}'
+
+
+class MembershipCoalescer(object):
+    """
+    Lets only the latest join or un-join of a (username, course_key) pair reach NodeBB.
+
+    Every dispatched membership task gets a fresh token which replaces the token of the pair in the cache
+    once the transaction of the task is committed, so that a rolled back change never supersedes the
+    previous one. The task is delayed by MEMBERSHIP_COALESCE_WINDOW seconds and, when it runs, skips itself
+    if a newer task has replaced its token in the meantime.
+    """
+
+    def __init__(self):
+        edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+        self.cache = caches[edly_settings.get('CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+        self.window = edly_settings.get('MEMBERSHIP_COALESCE_WINDOW', DEFAULT_MEMBERSHIP_COALESCE_WINDOW)
+        self.ttl = edly_settings.get('MEMBERSHIP_COALESCE_TTL', DEFAULT_MEMBERSHIP_COALESCE_TTL)
+
+    @staticmethod
+    def new_token():
+        """
+        Returns:
+            str: Token to pass to the task about to be dispatched.
+        """
+        return uuid.uuid4().hex
+
+    def claim(self, username, course_key, token):
+        """
+        Makes the task dispatched with token the latest one of the pair.
+
+        Args:
+            username (str): Username of edX User whose membership changes.
+            course_key (CourseKey): Id of the edX course.
+            token (str): Token the task was dispatched with.
+        """
+        self.cache.set(MEMBERSHIP_KEY.format(username, course_key), token, self.ttl)
+
+    def is_latest(self, username, course_key, token):
+        """
+        Args:
+            username (str): Username of edX User whose membership changes.
+            course_key (CourseKey): Id of the edX course.
+            token (str): Token the task was dispatched with.
+
+        Returns:
+            bool: False if a newer task was dispatched for the pair, True otherwise or if the token has expired.
+        """
+        latest_token = self.cache.get(MEMBERSHIP_KEY.format(username, course_key))
+        return latest_token is None or latest_token == token
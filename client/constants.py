@@ -23,5 +23,47 @@ DEFAULT_GROUPS = [
 ]
 
 NODEBB_ADMIN_UID = 1
+MAX_RETRIES = 3
 BAD_REQUEST = 400
+NOT_FOUND = 404
+CONFLICT = 409
 CONNECTION_ERROR = 500
+# Outside of the HTTP range, so that a 503 of NodeBB is not mistaken for a call the open circuit refused.
+CIRCUIT_OPEN = 1503
+TOO_MANY_REQUESTS = 429
+TIMEOUT_ERROR = 504
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 10
+DEFAULT_READ_CACHE_TTL = 60
+DEFAULT_READ_CACHE_ETAG_TTL = 60 * 60 * 24
+TASK_DEADLINE_MARGIN = 1
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_MAX_IN_FLIGHT = 10
+
+LIVE_PRIORITY = 'live'
+BULK_PRIORITY = 'bulk'
+
+DEFAULT_CACHE_ALIAS = 'default'
+DEFAULT_CIRCUIT_BREAKER_FAILURE_THRESHOLD = 20
+DEFAULT_CIRCUIT_BREAKER_FAILURE_WINDOW = 60
+DEFAULT_CIRCUIT_BREAKER_RECOVERY_TIMEOUT = 30
+DEFAULT_RATE_LIMIT_BULK_SHARE = 0.5
+DEFAULT_RATE_LIMIT_MAX_WAIT = 5
+DEFAULT_RATE_LIMIT_BACKOFF = 10
+DEFAULT_IDENTITY_CACHE_SIZE = 10000
+DEFAULT_IDENTITY_CACHE_TTL = 60 * 60
+DEFAULT_IDENTITY_CACHE_LOCAL_TTL = 60
+DEFAULT_BATCH_CHUNK_SIZE = 1000
+DEFAULT_COURSE_CHUNK_SIZE = 10
+DEFAULT_MEMBERSHIP_COALESCE_WINDOW = 5
+DEFAULT_MEMBERSHIP_COALESCE_TTL = 60 * 60
+DEFAULT_DISPATCH_BATCH_SIZE = 50
+DEFAULT_OUTBOX_BATCH_SIZE = 100
+DEFAULT_OUTBOX_LEASE = 5 * 60
+DEFAULT_OUTBOX_HOLD_TIMEOUT = 60 * 60 * 24
+HOLD_SWEEP_INTERVAL = 60 * 60
+DEFAULT_RETRY_POLICY = {'max_retries': MAX_RETRIES, 'base': 5, 'cap': 60 * 10, 'budget': 100}
+DEFAULT_RETRY_BUDGET_WINDOW = 60
+LANE_SLOT_POLL_INTERVAL = 0.05
@@ -0,0 +1,121 @@
+"""
+Dead letters of the NodeBB sync operations.
+
+Operations which ran out of retries, or were refused by the retry budget, are saved as EdxNodeBBDeadLetter
+rows instead of being dropped. Once NodeBB recovers they are replayed in bulk, with bounded concurrency.
+"""
+import json
+from logging import getLogger
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings as django_settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from openedx.features.openedx_edly_discussion.client.constants import DEFAULT_MAX_IN_FLIGHT, DEFAULT_OUTBOX_BATCH_SIZE
+from openedx.features.openedx_edly_discussion.models import EdxNodeBBDeadLetter
+
+log = getLogger(__name__)
+
+
+def save_dead_letter(task_name, args=(), kwargs=None, status_code=None, response=None, attempts=0):
+    """
+    Args:
+        task_name (str): Name of the Celery task of the operation.
+        args (tuple): Positional arguments of the task.
+        kwargs (dictionary): Keyword arguments of the task.
+        status_code (int): Status code of the last NodeBB call, None if the operation crashed.
+        response (str): Response of the last NodeBB call.
+        attempts (int): Times the operation ran.
+
+    Returns:
+        EdxNodeBBDeadLetter: Row of the operation.
+    """
+    return EdxNodeBBDeadLetter.objects.create(
+        task_name=task_name,
+        args=json.dumps(list(args or ())),
+        kwargs=json.dumps(kwargs or {}, sort_keys=True),
+        status_code=status_code,
+        response='' if response is None else str(response),
+        attempts=attempts,
+    )
+
+
+class DeadLetterReplayer(object):
+    """
+    Replays the dead letters which were not replayed yet, in id order and in batches run by a thread pool.
+
+    An operation which fails again keeps its row, with one more attempt, for a later replay. Identical
+    operations of a batch run only once.
+    """
+
+    def __init__(self, batch_size=None, concurrency=None, task_name=None):
+        edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+        self.batch_size = batch_size or edly_settings.get('OUTBOX_BATCH_SIZE', DEFAULT_OUTBOX_BATCH_SIZE)
+        self.concurrency = concurrency or edly_settings.get('OUTBOX_CONCURRENCY', DEFAULT_MAX_IN_FLIGHT)
+        self.task_name = task_name
+
+    def get_rows(self, after_id, limit):
+        rows = EdxNodeBBDeadLetter.objects.filter(replayed__isnull=True, id__gt=after_id)
+        if self.task_name:
+            rows = rows.filter(task_name__endswith=self.task_name)
+
+        return list(rows.order_by('id')[:limit])
+
+    @staticmethod
+    def run(rows):
+        """
+        Runs the operation shared by rows, in a thread of the pool.
+
+        Returns:
+            tuple: Tuple in the form (rows, succeeded).
+        """
+        from openedx.features.openedx_edly_discussion.client.tasks import OperationDeferred, run_operation
+
+        row = rows[0]
+        try:
+            run_operation(row.task_name, json.loads(row.args), json.loads(row.kwargs), inline=True)
+            return rows, True
+        except OperationDeferred:
+            return rows, False
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Failure: replay of {} with kwargs: {}'.format(row.task_name, row.kwargs))
+            return rows, False
+        finally:
+            connections.close_all()
+
+    def replay(self, limit=None):
+        """
+        Args:
+            limit (int): Dead letters to replay at most, all of them if None.
+
+        Returns:
+            tuple: Tuple in the form (replayed, failed) with the number of rows of each outcome.
+        """
+        replayed = failed = last_id = 0
+        while limit is None or replayed + failed < limit:
+            batch_size = self.batch_size if limit is None else min(self.batch_size, limit - replayed - failed)
+            rows = self.get_rows(last_id, batch_size)
+            if not rows:
+                break
+
+            last_id = rows[-1].id
+            operations = {}
+            for row in rows:
+                operations.setdefault((row.task_name, row.args, row.kwargs), []).append(row)
+
+            replayed_ids, failed_ids = [], []
+            pool = ThreadPool(min(self.concurrency, len(operations)))
+            try:
+                for operation_rows, succeeded in pool.imap_unordered(self.run, list(operations.values())):
+                    (replayed_ids if succeeded else failed_ids).extend(row.id for row in operation_rows)
+            finally:
+                pool.close()
+                pool.join()
+
+            EdxNodeBBDeadLetter.objects.filter(id__in=replayed_ids).update(replayed=timezone.now())
+            EdxNodeBBDeadLetter.objects.filter(id__in=failed_ids).update(attempts=F('attempts') + 1)
+            replayed += len(replayed_ids)
+            failed += len(failed_ids)
+
+        return replayed, failed
@@ -0,0 +1,148 @@
+"""
+Dispatches the Celery tasks of the signal handlers once the transaction which raised the signal is committed.
+
+Tasks dispatched within one transaction are collected and sent together after the commit, as batch tasks
+of up to DISPATCH_BATCH_SIZE operations. Tasks of rolled back transactions or savepoints are never sent.
+Tasks are routed to the queue of their lane, LIVE_PRIORITY unless stated otherwise.
+"""
+import threading
+
+from django.conf import settings as django_settings
+from django.db import transaction
+from openedx.features.openedx_edly_discussion.client.constants import DEFAULT_DISPATCH_BATCH_SIZE, LIVE_PRIORITY
+from openedx.features.openedx_edly_discussion.client.lanes import Lane
+from openedx.features.openedx_edly_discussion.client.outbox import add_to_outbox, is_outbox_enabled
+
+_pending_batches = threading.local()
+
+
+class PendingTask(object):
+    """
+    Task waiting for the commit of the transaction, registered as an on_commit callback of its own so
+    that Django drops it when its savepoint is rolled back.
+    """
+
+    def __init__(self, task, args, kwargs, options):
+        self.task = task
+        self.args = args
+        self.kwargs = kwargs
+        self.options = options
+        self.committed = False
+
+    def __call__(self):
+        self.committed = True
+
+    def send(self):
+        self.task.apply_async(args=self.args, kwargs=self.kwargs, **self.options)
+
+
+class PendingBatch(object):
+    """
+    on_commit callback of a transaction which sends its committed tasks. It is kept as the last callback
+    of the transaction, so that it runs after the callbacks of all of its tasks.
+
+    The batch of the current transaction is kept per thread and database alias, along with the entry it
+    was registered with, so that it is found without going through the callbacks of the transaction.
+    """
+
+    def __init__(self, using):
+        self.using = using
+        self.pending_tasks = []
+        # The batch belongs to the whole transaction, so that rolling back a savepoint does not drop it.
+        self.entry = (set(), self)
+
+    def __call__(self):
+        if getattr(_pending_batches, self.using, None) is self:
+            setattr(_pending_batches, self.using, None)
+
+        send_tasks([pending_task for pending_task in self.pending_tasks if pending_task.committed])
+
+
+def send_tasks(pending_tasks):
+    """
+    Sends the tasks of every lane as batch tasks, or as it is if the lane has a single task.
+
+    Args:
+        pending_tasks (list): PendingTask objects to send.
+    """
+    from openedx.features.openedx_edly_discussion.client.tasks import task_run_batch_on_nodebb
+
+    batch_size = django_settings.EDLY_DISCUSSION_SETTINGS.get('DISPATCH_BATCH_SIZE', DEFAULT_DISPATCH_BATCH_SIZE)
+    lanes = {}
+    for pending_task in pending_tasks:
+        lanes.setdefault(pending_task.options.get('routing_key'), []).append(pending_task)
+
+    for routing_key, lane_tasks in lanes.items():
+        for start in range(0, len(lane_tasks), batch_size):
+            batch = lane_tasks[start:start + batch_size]
+            if len(batch) == 1:
+                batch[0].send()
+                continue
+
+            operations = [(pending_task.task.name, pending_task.args, pending_task.kwargs) for pending_task in batch]
+            countdown = max(pending_task.options.get('countdown') or 0 for pending_task in batch)
+            task_run_batch_on_nodebb.apply_async(
+                args=(operations,), countdown=countdown or None, routing_key=routing_key
+            )
+
+
+def get_pending_batch(connection):
+    """
+    Moves the PendingBatch of the current transaction to the end of its on_commit callbacks, or registers a
+    new one there if the transaction has none yet.
+
+    Only the callbacks registered since the last dispatch are looked through, as the batch was last then.
+
+    Args:
+        connection: Database connection in an atomic block.
+
+    Returns:
+        PendingBatch: Batch of the current transaction.
+    """
+    run_on_commit = connection.run_on_commit
+    pending_batch = getattr(_pending_batches, connection.alias, None)
+    if pending_batch is not None:
+        for index in range(len(run_on_commit) - 1, -1, -1):
+            if run_on_commit[index] is pending_batch.entry:
+                if index != len(run_on_commit) - 1:
+                    run_on_commit.append(run_on_commit.pop(index))
+                return pending_batch
+
+    # A batch which is not registered anymore belongs to a transaction which was rolled back.
+    pending_batch = PendingBatch(connection.alias)
+    setattr(_pending_batches, connection.alias, pending_batch)
+    run_on_commit.append(pending_batch.entry)
+    return pending_batch
+
+
+def dispatch(task, args=(), kwargs=None, using=None, priority=LIVE_PRIORITY, on_commit=None, **options):
+    """
+    Sends a task after the current transaction is committed, right away if there is no transaction.
+
+    With USE_OUTBOX the task is stored in the outbox within the current transaction instead.
+
+    Args:
+        task (Task): Celery task to send.
+        args (tuple): Positional arguments of the task.
+        kwargs (dictionary): Keyword arguments of the task.
+        using (str): Alias of the database whose transaction is followed.
+        priority (str): LIVE_PRIORITY or BULK_PRIORITY, the lane whose queue the task is routed to.
+        on_commit (callable): Called once the transaction is committed, before the task is sent, right away if
+            there is no transaction and never if it is rolled back.
+        **options: Options of apply_async like countdown.
+    """
+    if is_outbox_enabled():
+        add_to_outbox(task, args, kwargs, countdown=options.get('countdown'))
+        return
+
+    if on_commit is not None:
+        transaction.on_commit(on_commit, using)
+
+    pending_task = PendingTask(task, tuple(args), kwargs or {}, dict(Lane(priority).options, **options))
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        pending_task.send()
+        return
+
+    transaction.on_commit(pending_task, using)
+    get_pending_batch(connection).pending_tasks.append(pending_task)
@@ -7,12 +7,15 @@ from __future__ import unicode_literals
 
 from openedx.features.openedx_edly_discussion.client import Client
 from openedx.features.openedx_edly_discussion.client.utils import (
-    get_course_id_from_group_slug,
+    CourseMapping,
     get_edx_user_from_nodebb_uid,
-    get_nodebb_category_relation_from_course_id,
+    get_edx_users_from_nodebb_uids,
     remove_course_enrollment_from_db,
+    remove_course_enrollments_from_db,
     save_course_enrollment_in_db,
-    save_group_relation_into_db
+    save_course_enrollments_in_db,
+    save_group_relation_into_db,
+    slugify_like_nodebb
 )
 
 
@@ -34,13 +37,26 @@ class NodeBBGroup(Client):
                 name: "name-organization-run",
             }
 
+        The create is idempotent: the group of a course which is mapped already is not created again, and
+        a group which NodeBB has already although the call failed is adopted.
+
         Returns:
             tuple: Tuple in the form (response_code, json_response) received from requests call.
         """
+        course_mapping = CourseMapping.load(course_id=course_id)
+        if course_mapping and course_mapping.slug:
+            return 200, {'slug': course_mapping.slug, 'name': course_mapping.name}
+
         response_code, json_response = self.post('/api/v2/groups', **payload)
 
         if response_code == 200:
             save_group_relation_into_db(course_id, group_slug=json_response['slug'], group_name=json_response['name'])
+        elif self.may_exist_already(response_code):
+            lookup_code, lookup_response = self.get_group(slugify_like_nodebb(payload['name']), use_cache=False)
+            nodebb_group = lookup_response.get('group') if lookup_code == 200 else None
+            if nodebb_group:
+                save_group_relation_into_db(course_id, group_slug=nodebb_group['slug'], group_name=nodebb_group['name'])
+                return 200, {'slug': nodebb_group['slug'], 'name': nodebb_group['name']}
 
         return response_code, json_response
 
@@ -54,15 +70,47 @@ class NodeBBGroup(Client):
         Returns:
             tuple: Tuple in the form (response_code, json_response) received from requests call.
         """
-        return self.delete('/api/v2/groups/{}'.format(group_slug))
+        response_code, json_response = self.delete('/api/v2/groups/{}'.format(group_slug))
+        if response_code == 200:
+            self.forget('/api/groups/{}'.format(group_slug))
+            self.forget('/api/groups/{}/members'.format(group_slug))
+
+        return response_code, json_response
+
+    def get_group(self, group_slug, use_cache=True):
+        """
+        Fetches a NodeBB Group from the read api.
+
+        Args:
+            group_slug (str): Slug of the group.
+            use_cache (bool): Set to False to skip the read cache.
 
-    def add_member(self, uid, group_slug):
+        Returns:
+            tuple: Tuple in the form (response_code, json_response) received from requests call.
+        """
+        return self.get('/api/groups/{}'.format(group_slug), use_cache=use_cache)
+
+    def get_members(self, group_slug, use_cache=True):
+        """
+        Fetches the members of a NodeBB Group from the read api.
+
+        Args:
+            group_slug (str): Slug of the group.
+            use_cache (bool): Set to False to skip the read cache.
+
+        Returns:
+            tuple: Tuple in the form (response_code, json_response) received from requests call.
+        """
+        return self.get('/api/groups/{}/members'.format(group_slug), use_cache=use_cache)
+
+    def add_member(self, uid, group_slug, course_mapping=None):
         """
         Add member to the NodeBB group and save its corresponding record in database.
 
         Args:
             uid (int): NodeBB user id of the  user to be add to group
             group_slug (str): Slug of group user joining.
+            course_mapping (CourseMapping): Mapping of the course, looked up from group_slug if not given.
 
         Returns:
             tuple: Tuple in the form (response_code, json_response) received from requests call.
@@ -71,20 +119,21 @@ class NodeBBGroup(Client):
         response_code, json_response = self.put('/api/v2/groups/{}/membership/{}'.format(group_slug, uid))
 
         if response_code == 200:
-            course_id = get_course_id_from_group_slug(group_slug)
+            course_mapping = course_mapping or CourseMapping.load(group_slug=group_slug)
             edx_user = get_edx_user_from_nodebb_uid(uid)
-            nodebb_cid = get_nodebb_category_relation_from_course_id(course_id)
-            save_course_enrollment_in_db(edx_user, course_id, nodebb_cid)
+            save_course_enrollment_in_db(edx_user, course_mapping.course_id, course_mapping.cid)
+            self.forget('/api/groups/{}/members'.format(group_slug))
 
         return response_code, json_response
 
-    def remove_member(self, uid, group_slug):
+    def remove_member(self, uid, group_slug, course_mapping=None):
         """
         Remove member from NodeBB group and update database accordingly.
 
         Args:
             uid (int): NodeBB user id of the user to remove from group
             group_slug (str): Slug of group from which the user is being removed.
+            course_mapping (CourseMapping): Mapping of the course, looked up from group_slug if not given.
 
         Returns:
             tuple: Tuple in the form (response_code, json_response)
@@ -93,9 +142,70 @@ class NodeBBGroup(Client):
         response_code, json_response = self.delete('/api/v2/groups/{}/membership/{}'.format(group_slug, uid))
 
         if response_code == 200:
-            course_id = get_course_id_from_group_slug(group_slug)
+            course_mapping = course_mapping or CourseMapping.load(group_slug=group_slug)
             edx_user = get_edx_user_from_nodebb_uid(uid)
-            nodebb_cid = get_nodebb_category_relation_from_course_id(course_id)
-            remove_course_enrollment_from_db(edx_user, course_id, nodebb_cid)
+            remove_course_enrollment_from_db(edx_user, course_mapping.course_id, course_mapping.cid)
+            self.forget('/api/groups/{}/members'.format(group_slug))
 
         return response_code, json_response
+
+    def _change_members(self, method, uids, group_slug):
+        """
+        Sends one membership call per uid concurrently.
+
+        Returns:
+            dict: Tuples in the form (response_code, json_response) keyed by uid.
+        """
+        uids_by_path = {'/api/v2/groups/{}/membership/{}'.format(group_slug, uid): uid for uid in uids}
+        operations = [(method, path, None) for path in uids_by_path]
+
+        return {
+            uids_by_path[path]: (response_code, json_response)
+            for (_, path, _), response_code, json_response in self.call_many(operations)
+        }
+
+    def add_members(self, uids, group_slug):
+        """
+        Add many members to the NodeBB group and save their records in database in bulk.
+
+        The course and category are resolved once for all members instead of once per member.
+
+        Args:
+            uids (list): NodeBB user ids of the users to add to group
+            group_slug (str): Slug of group users are joining.
+
+        Returns:
+            dict: Tuples in the form (response_code, json_response) keyed by uid.
+        """
+        responses = self._change_members('PUT', uids, group_slug)
+        joined_uids = [uid for uid, (response_code, _) in responses.items() if response_code == 200]
+
+        if joined_uids:
+            course_mapping = CourseMapping.load(group_slug=group_slug)
+            edx_users = get_edx_users_from_nodebb_uids(joined_uids).values()
+            save_course_enrollments_in_db(edx_users, course_mapping.course_id, course_mapping.cid)
+            self.forget('/api/groups/{}/members'.format(group_slug))
+
+        return responses
+
+    def remove_members(self, uids, group_slug):
+        """
+        Remove many members from the NodeBB group and delete their records from database in bulk.
+
+        Args:
+            uids (list): NodeBB user ids of the users to remove from group
+            group_slug (str): Slug of group from which the users are being removed.
+
+        Returns:
+            dict: Tuples in the form (response_code, json_response) keyed by uid.
+        """
+        responses = self._change_members('DELETE', uids, group_slug)
+        removed_uids = [uid for uid, (response_code, _) in responses.items() if response_code == 200]
+
+        if removed_uids:
+            course_mapping = CourseMapping.load(group_slug=group_slug)
+            edx_users = get_edx_users_from_nodebb_uids(removed_uids).values()
+            remove_course_enrollments_from_db(edx_users, course_mapping.course_id, course_mapping.cid)
+            self.forget('/api/groups/{}/members'.format(group_slug))
+
+        return responses
@@ -0,0 +1,114 @@
+"""
+Two tier cache of the edX to NodeBB identity mappings: a bounded LRU in every worker process on top of the
+shared Django cache. Entries are dropped by the signal handlers whenever a mapping row is saved or deleted.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from openedx.features.openedx_edly_discussion.client.constants import (
+    DEFAULT_CACHE_ALIAS,
+    DEFAULT_IDENTITY_CACHE_LOCAL_TTL,
+    DEFAULT_IDENTITY_CACHE_SIZE,
+    DEFAULT_IDENTITY_CACHE_TTL
+)
+
+IDENTITY_CACHE_KEY = 'edly_discussion:identity:{}'
+
+_identity_cache = None
+_identity_cache_lock = threading.Lock()
+
+
+class LRUCache(object):
+    """
+    Thread safe LRU of bounded size whose entries also expire after a time to live.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] < time.time():
+                return None
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + self.ttl)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class IdentityCache(object):
+    """
+    Looks entries up in the LRU of the worker first and then in the shared cache.
+
+    The LRU keeps entries for IDENTITY_CACHE_LOCAL_TTL seconds only, because the signal handlers can
+    clear the shared cache but not the LRUs of other workers.
+    """
+
+    def __init__(self):
+        edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+        self.shared = caches[edly_settings.get('CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+        self.ttl = edly_settings.get('IDENTITY_CACHE_TTL', DEFAULT_IDENTITY_CACHE_TTL)
+        self.local = LRUCache(
+            edly_settings.get('IDENTITY_CACHE_SIZE', DEFAULT_IDENTITY_CACHE_SIZE),
+            edly_settings.get('IDENTITY_CACHE_LOCAL_TTL', DEFAULT_IDENTITY_CACHE_LOCAL_TTL)
+        )
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(IDENTITY_CACHE_KEY.format(key))
+            if value is not None:
+                self.local.set(key, value)
+
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        self.shared.set(IDENTITY_CACHE_KEY.format(key), value, self.ttl)
+
+    def set_many(self, entries):
+        for key, value in entries.items():
+            self.local.set(key, value)
+        self.shared.set_many(
+            dict((IDENTITY_CACHE_KEY.format(key), value) for key, value in entries.items()), self.ttl
+        )
+
+    def delete(self, *keys):
+        for key in keys:
+            self.local.delete(key)
+        self.shared.delete_many([IDENTITY_CACHE_KEY.format(key) for key in keys])
+
+
+def get_identity_cache():
+    """
+    Returns:
+        IdentityCache: Identity cache of the current process.
+    """
+    global _identity_cache
+
+    if _identity_cache is None:
+        with _identity_cache_lock:
+            if _identity_cache is None:
+                _identity_cache = IdentityCache()
+
+    return _identity_cache
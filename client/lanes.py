@@ -0,0 +1,97 @@
+"""
+Lanes of the NodeBB sync work: live work raised by learners and bulk work of the sync commands.
+
+Every lane has a Celery queue of its own, so that a backfill never delays live events, and a cap on the
+NodeBB calls it runs at the same time across all workers. The slots of the cap are kept in the Django
+cache, each of them expires on its own if the worker holding it dies.
+"""
+import time
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from openedx.features.openedx_edly_discussion.client.constants import (
+    BULK_PRIORITY,
+    DEFAULT_CACHE_ALIAS,
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_RATE_LIMIT_MAX_WAIT,
+    LANE_SLOT_POLL_INTERVAL,
+    LIVE_PRIORITY
+)
+
+SLOT_KEY = 'edly_discussion:lane:{}:slot:{}'
+
+
+class Lane(object):
+    """
+    Routing and concurrency cap of LIVE_PRIORITY or BULK_PRIORITY work.
+
+    LANES in EDLY_DISCUSSION_SETTINGS maps a priority to its 'queue' and 'max_in_flight', the live lane
+    defaults to HIGH_PRIORITY_QUEUE without a cap and the bulk lane to LOW_PRIORITY_QUEUE with a cap of
+    10 calls.
+    """
+
+    def __init__(self, priority=LIVE_PRIORITY):
+        edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+        default_lanes = {
+            LIVE_PRIORITY: {'queue': django_settings.HIGH_PRIORITY_QUEUE, 'max_in_flight': None},
+            BULK_PRIORITY: {'queue': django_settings.LOW_PRIORITY_QUEUE, 'max_in_flight': DEFAULT_MAX_IN_FLIGHT},
+        }
+        lane = dict(default_lanes[priority], **(edly_settings.get('LANES') or {}).get(priority, {}))
+
+        self.priority = priority
+        self.queue = lane['queue']
+        self.max_in_flight = lane['max_in_flight']
+        self.max_wait = edly_settings.get('RATE_LIMIT_MAX_WAIT', DEFAULT_RATE_LIMIT_MAX_WAIT)
+        self.cache = caches[edly_settings.get('CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+
+    @property
+    def options(self):
+        """
+        Returns:
+            dictionary: Options of apply_async which route a task to the queue of the lane.
+        """
+        return {'routing_key': self.queue} if self.queue else {}
+
+    def acquire(self, ttl, deadline=None):
+        """
+        Takes a slot of the lane for a call, waiting up to RATE_LIMIT_MAX_WAIT seconds for one.
+
+        Args:
+            ttl (float): Seconds after which the slot frees itself, should outlast the call.
+            deadline (float): Timestamp after which the caller can not wait anymore.
+
+        Returns:
+            str: Cache key of the slot to release, '' if the lane has no cap, None if no slot got free.
+        """
+        if not self.max_in_flight:
+            return ''
+
+        give_up_at = time.time() + self.max_wait
+        if deadline is not None:
+            give_up_at = min(give_up_at, deadline)
+        while True:
+            for slot in range(self.max_in_flight):
+                key = SLOT_KEY.format(self.priority, slot)
+                if self.cache.add(key, True, int(ttl) + 1):
+                    return key
+            if time.time() + LANE_SLOT_POLL_INTERVAL > give_up_at:
+                return None
+            time.sleep(LANE_SLOT_POLL_INTERVAL)
+
+    def release(self, key):
+        if key:
+            self.cache.delete(key)
+
+
+def send_to_lane(task, priority, args=(), kwargs=None, **options):
+    """
+    Sends a task to the queue of the lane of priority.
+
+    Args:
+        task (Task): Celery task to send.
+        priority (str): LIVE_PRIORITY or BULK_PRIORITY depending on where the work comes from.
+        args (tuple): Positional arguments of the task.
+        kwargs (dictionary): Keyword arguments of the task.
+        **options: Options of apply_async like countdown.
+    """
+    return task.apply_async(args=args, kwargs=kwargs, **dict(Lane(priority).options, **options))
@@ -0,0 +1,190 @@
+"""
+Metric sinks for the NodeBB client, the sink is chosen with METRICS_SINK in EDLY_DISCUSSION_SETTINGS.
+"""
+import os
+import re
+import socket
+import threading
+from collections import defaultdict, deque
+from logging import getLogger
+
+from django.conf import settings as django_settings
+from django.utils.module_loading import import_string
+
+log = getLogger(__name__)
+
+ENDPOINT_TEMPLATES = [
+    '/api/v2/users',
+    '/api/v2/users/{uid}',
+    '/api/v2/categories',
+    '/api/v2/categories/{cid}',
+    '/api/v2/categories/{cid}/privileges',
+    '/api/v2/groups',
+    '/api/v2/groups/{slug}',
+    '/api/v2/groups/{slug}/membership/{uid}',
+    '/api/user/username/{username}',
+    '/api/categories',
+    '/api/category/{cid}',
+    '/api/groups/{slug}',
+    '/api/groups/{slug}/members',
+]
+ENDPOINT_PATTERNS = [
+    (re.compile('^{}/?$'.format(re.sub(r'\\{\w+\\}', '[^/]+', re.escape(template)))), template)
+    for template in ENDPOINT_TEMPLATES
+]
+
+_sink = None
+_sink_pid = None
+
+
+def get_endpoint_template(path):
+    """
+    Maps an api path to its endpoint template, so that metrics of the same endpoint are grouped.
+
+    Args:
+        path (str): Api path like /api/v2/groups/edx-demo/membership/5
+
+    Returns:
+        str: Endpoint template like /api/v2/groups/{slug}/membership/{uid}, unknown paths have
+            their numeric segments replaced by {id}.
+    """
+    path = path.split('?')[0]
+    for pattern, template in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return template
+
+    return re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+
+class InMemorySink(object):
+    """
+    Keeps metrics in the memory of the process, mostly useful for benchmarks and the shell.
+    """
+
+    def __init__(self, max_samples=10000):
+        self.max_samples = max_samples
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.timings = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, tags):
+        return (name,) + tuple(sorted((tags or {}).items()))
+
+    def timing(self, name, value, tags=None):
+        with self._lock:
+            self.timings[self._key(name, tags)].append(value)
+
+    def increment(self, name, value=1, tags=None):
+        with self._lock:
+            self.counters[self._key(name, tags)] += value
+
+    def gauge(self, name, value, tags=None):
+        with self._lock:
+            self.gauges[self._key(name, tags)] = value
+
+    def percentile(self, name, percent, tags=None):
+        """
+        Args:
+            name (str): Name of the timing metric.
+            percent (float): Percentile between 0 and 100.
+            tags (dictionary): Tags of the timing metric.
+
+        Returns:
+            float: Value at the percentile among the latest samples, None if there is no sample.
+        """
+        with self._lock:
+            samples = sorted(self.timings.get(self._key(name, tags), []))
+
+        if not samples:
+            return None
+
+        return samples[min(int(len(samples) * percent / 100.0), len(samples) - 1)]
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.timings.clear()
+
+
+class StatsdSink(object):
+    """
+    Sends metrics over UDP in the StatsD line format, tags are appended to the metric name.
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='edly_discussion'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, name, tags):
+        segments = [self.prefix, name] if self.prefix else [name]
+        for _, tag_value in sorted((tags or {}).items()):
+            segments.append(re.sub(r'[^\w]+', '_', str(tag_value)).strip('_'))
+
+        return '.'.join(segments)
+
+    def _send(self, line):
+        try:
+            self._socket.sendto(line.encode('utf-8'), self.address)
+        except socket.error:
+            pass
+
+    def timing(self, name, value, tags=None):
+        self._send('{}:{}|ms'.format(self._name(name, tags), value))
+
+    def increment(self, name, value=1, tags=None):
+        self._send('{}:{}|c'.format(self._name(name, tags), value))
+
+    def gauge(self, name, value, tags=None):
+        self._send('{}:{}|g'.format(self._name(name, tags), value))
+
+
+class LoggingSink(object):
+    """
+    Writes every metric as a log line.
+    """
+
+    def timing(self, name, value, tags=None):
+        log.info('metric timing {}: {:.2f} {}'.format(name, value, tags or {}))
+
+    def increment(self, name, value=1, tags=None):
+        log.info('metric counter {}: {} {}'.format(name, value, tags or {}))
+
+    def gauge(self, name, value, tags=None):
+        log.info('metric gauge {}: {} {}'.format(name, value, tags or {}))
+
+
+METRICS_SINKS = {
+    'memory': InMemorySink,
+    'statsd': StatsdSink,
+    'logging': LoggingSink,
+}
+
+
+def get_metrics_sink():
+    """
+    Returns the metric sink of the current process configured by METRICS_SINK, which can be
+    memory, statsd, logging or the dotted path of a class. METRICS_SINK_OPTIONS are passed to it.
+
+    Returns:
+        object: Metric sink, None if metrics are disabled.
+    """
+    global _sink, _sink_pid
+
+    pid = os.getpid()
+    if _sink_pid == pid:
+        return _sink
+
+    edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+    sink_name = edly_settings.get('METRICS_SINK')
+    if not sink_name:
+        _sink = None
+    else:
+        sink_class = METRICS_SINKS.get(sink_name) or import_string(sink_name)
+        _sink = sink_class(**(edly_settings.get('METRICS_SINK_OPTIONS') or {}))
+
+    _sink_pid = pid
+    return _sink
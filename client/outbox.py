@@ -0,0 +1,371 @@
+"""
+Transactional outbox of the NodeBB sync operations.
+
+With USE_OUTBOX in EDLY_DISCUSSION_SETTINGS the signal handlers store their operations as EdxNodeBBOutbox
+rows within the edX transaction instead of sending Celery tasks, so no operation is lost when the broker
+is down. The drainer claims pending rows in batches, runs them with bounded concurrency and marks them
+done, giving at-least-once delivery.
+
+Operations which need a user or a course group that NodeBB does not have yet are held in the outbox,
+with or without USE_OUTBOX, and released once the prerequisite is saved.
+"""
+import json
+import uuid
+from datetime import timedelta
+from inspect import getcallargs
+from logging import getLogger
+from multiprocessing.pool import ThreadPool
+
+from celery import current_app
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from opaque_keys.edx.locator import CourseLocator
+from openedx.features.openedx_edly_discussion.client.constants import (
+    DEFAULT_CACHE_ALIAS,
+    DEFAULT_MAX_IN_FLIGHT,
+    DEFAULT_OUTBOX_BATCH_SIZE,
+    DEFAULT_OUTBOX_HOLD_TIMEOUT,
+    DEFAULT_OUTBOX_LEASE,
+    HOLD_SWEEP_INTERVAL,
+    LIVE_PRIORITY
+)
+from openedx.features.openedx_edly_discussion.client.dead_letters import save_dead_letter
+from openedx.features.openedx_edly_discussion.client.retry_policy import RetryPolicy
+from openedx.features.openedx_edly_discussion.models import EdxNodeBBOutbox
+
+FAILURE_COUNTDOWN = 60
+USER_DEPENDENCY = 'user:{}'
+COURSE_DEPENDENCY = 'course:{}'
+HOLD_SWEEP_KEY = 'edly_discussion:outbox:hold_sweep'
+log = getLogger(__name__)
+
+
+def is_outbox_enabled():
+    return bool(django_settings.EDLY_DISCUSSION_SETTINGS.get('USE_OUTBOX'))
+
+
+def add_to_outbox(task, args=(), kwargs=None, countdown=None, waiting_for=''):
+    """
+    Stores an operation in the outbox, within the current transaction if there is one.
+
+    Args:
+        task (Task): Celery task of the operation.
+        args (tuple): Positional arguments of the task.
+        kwargs (dictionary): Keyword arguments of the task.
+        countdown (float): Seconds after which the operation may run.
+        waiting_for (str): Prerequisite the operation is held for, like USER_DEPENDENCY or COURSE_DEPENDENCY.
+
+    Returns:
+        EdxNodeBBOutbox: Row of the operation.
+    """
+    if waiting_for:
+        expire_held_operations_once_in_a_while()
+
+    return EdxNodeBBOutbox.objects.create(
+        task_name=task.name,
+        args=json.dumps(list(args)),
+        kwargs=json.dumps(kwargs or {}, sort_keys=True),
+        status=EdxNodeBBOutbox.HELD if waiting_for else EdxNodeBBOutbox.PENDING,
+        available_at=timezone.now() + timedelta(seconds=countdown or 0),
+        waiting_for=waiting_for,
+    )
+
+
+def release_held_operations(waiting_for):
+    """
+    Releases the operations held for a prerequisite which now exists, in the order they were held.
+
+    With USE_OUTBOX the rows are handed to the drainer, otherwise their tasks are dispatched to the lane
+    they were sent to and the rows are deleted.
+
+    Args:
+        waiting_for (str): Prerequisite which is saved, like USER_DEPENDENCY or COURSE_DEPENDENCY.
+
+    Returns:
+        int: Number of operations released.
+    """
+    held_rows = EdxNodeBBOutbox.objects.filter(status=EdxNodeBBOutbox.HELD, waiting_for=waiting_for)
+    if is_outbox_enabled():
+        return held_rows.update(status=EdxNodeBBOutbox.PENDING, available_at=timezone.now(), waiting_for='')
+
+    from openedx.features.openedx_edly_discussion.client.dispatch import dispatch
+
+    held_rows = list(held_rows.order_by('id'))
+    for row in held_rows:
+        kwargs = json.loads(row.kwargs)
+        dispatch(
+            import_string(row.task_name), args=json.loads(row.args), kwargs=kwargs,
+            priority=kwargs.get('priority', LIVE_PRIORITY)
+        )
+
+    EdxNodeBBOutbox.objects.filter(id__in=[row.id for row in held_rows]).delete()
+    return len(held_rows)
+
+
+def get_entity(row):
+    """
+    Tells which NodeBB entity the operation of an outbox row writes to, so that the operations of one entity
+    run in the order they were stored.
+
+    Args:
+        row (EdxNodeBBOutbox): Row of the operation.
+
+    Returns:
+        str: USER_DEPENDENCY of the user for user and membership operations, COURSE_DEPENDENCY of the course
+            for course operations, or a key of the row itself if the entity is not known.
+    """
+    try:
+        call_args = getcallargs(current_app.tasks[row.task_name].run, *json.loads(row.args), **json.loads(row.kwargs))
+    except (KeyError, TypeError):
+        return 'row:{}'.format(row.id)
+
+    for value in list(call_args.values()):
+        if isinstance(value, dict):
+            call_args.update(value)
+
+    if call_args.get('username'):
+        return USER_DEPENDENCY.format(call_args['username'])
+    if call_args.get('course_run'):
+        return COURSE_DEPENDENCY.format(
+            CourseLocator(call_args['organization'], call_args['course_name'], call_args['course_run'])
+        )
+    if call_args.get('category_id'):
+        return 'category:{}'.format(call_args['category_id'])
+    if call_args.get('group_slug'):
+        return 'group:{}'.format(call_args['group_slug'])
+
+    return 'row:{}'.format(row.id)
+
+
+class OutboxDrainer(object):
+    """
+    Claims batches of due outbox rows and runs their operations in a thread pool.
+
+    Rows are claimed by marking them processing with a token of the drainer, so several drainers can run
+    side by side. Claims older than OUTBOX_LEASE seconds are taken over, e.g. after a drainer crashed.
+    The rows of a batch are partitioned by the entity they write to: the operations of a partition run one
+    after the other in row order, and only the partitions run in parallel. Once an operation is deferred, the
+    next ones of its partition are deferred along with it. Identical operations which follow each other run
+    only once. Operations run with the attempts of their row as retries, so their retry policy moves them to
+    the dead letters once they are out of retries.
+    """
+
+    def __init__(self, batch_size=None, concurrency=None):
+        edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+        self.batch_size = batch_size or edly_settings.get('OUTBOX_BATCH_SIZE', DEFAULT_OUTBOX_BATCH_SIZE)
+        self.concurrency = concurrency or edly_settings.get('OUTBOX_CONCURRENCY', DEFAULT_MAX_IN_FLIGHT)
+        self.lease = edly_settings.get('OUTBOX_LEASE', DEFAULT_OUTBOX_LEASE)
+
+    def claim(self):
+        """
+        Returns:
+            list: EdxNodeBBOutbox rows claimed by this call.
+        """
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        due_rows = EdxNodeBBOutbox.objects.filter(status=EdxNodeBBOutbox.PENDING, available_at__lte=now)
+        expired_rows = EdxNodeBBOutbox.objects.filter(
+            status=EdxNodeBBOutbox.PROCESSING, claimed_at__lt=now - timedelta(seconds=self.lease)
+        )
+        row_ids = list(due_rows.order_by('id').values_list('id', flat=True)[:self.batch_size])
+        if len(row_ids) < self.batch_size:
+            row_ids += list(expired_rows.order_by('id').values_list('id', flat=True)[:self.batch_size - len(row_ids)])
+
+        (due_rows | expired_rows).filter(id__in=row_ids).update(
+            status=EdxNodeBBOutbox.PROCESSING, claimed_by=token, claimed_at=now
+        )
+        return list(EdxNodeBBOutbox.objects.filter(claimed_by=token, status=EdxNodeBBOutbox.PROCESSING).order_by('id'))
+
+    @staticmethod
+    def run(rows):
+        """
+        Runs the operation shared by rows, in a thread of the pool.
+
+        Returns:
+            tuple: Tuple in the form (rows, deferred) where deferred is None if the operation is done.
+        """
+        from openedx.features.openedx_edly_discussion.client.tasks import OperationDeferred, run_operation
+
+        row = rows[0]
+        try:
+            run_operation(
+                row.task_name, json.loads(row.args), json.loads(row.kwargs), inline=True, retries=row.attempts
+            )
+            return rows, None
+        except OperationDeferred as deferred:
+            return rows, deferred
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Failure: outbox operation {} with kwargs: {}'.format(row.task_name, row.kwargs))
+            return rows, OperationDeferred(FAILURE_COUNTDOWN)
+        finally:
+            connections.close_all()
+
+    @classmethod
+    def run_partition(cls, operations):
+        """
+        Runs the operations of one entity in order, in a thread of the pool.
+
+        Args:
+            operations (list): Lists of rows sharing an operation, in row order.
+
+        Returns:
+            list: Tuples in the form (rows, deferred) like run returns them.
+        """
+        from openedx.features.openedx_edly_discussion.client.tasks import OperationDeferred
+
+        results = []
+        for rows in operations:
+            if results and results[-1][1] is not None:
+                results.append((rows, OperationDeferred(results[-1][1].countdown, spends_retry=False)))
+            else:
+                results.append(cls.run(rows))
+
+        return results
+
+    def drain_once(self):
+        """
+        Claims and runs one batch of operations.
+
+        Returns:
+            int: Number of rows claimed, 0 once the outbox has no due rows.
+        """
+        rows = self.claim()
+        partitions = {}
+        for row in rows:
+            operations = partitions.setdefault(get_entity(row), [])
+            operation = (row.task_name, row.args, row.kwargs)
+            last_rows = operations[-1] if operations else []
+            if last_rows and (last_rows[0].task_name, last_rows[0].args, last_rows[0].kwargs) == operation:
+                last_rows.append(row)
+            else:
+                operations.append([row])
+
+        done_ids = []
+        pool = ThreadPool(min(self.concurrency, len(partitions)) or 1)
+        try:
+            for results in pool.imap_unordered(self.run_partition, list(partitions.values())):
+                for operation_rows, deferred in results:
+                    if deferred is None:
+                        done_ids.extend(row.id for row in operation_rows)
+                    else:
+                        self.defer(operation_rows, deferred)
+        finally:
+            pool.close()
+            pool.join()
+
+        EdxNodeBBOutbox.objects.filter(id__in=done_ids).update(status=EdxNodeBBOutbox.DONE, processed=timezone.now())
+        return len(rows)
+
+    @staticmethod
+    def defer(rows, deferred):
+        """
+        Puts rows back into the outbox to run after the countdown, or fails them and saves them to the dead
+        letters once they ran out of retries, i.e. after crashing on every attempt.
+        """
+        for row in rows:
+            attempts = row.attempts + 1 if deferred.spends_retry else row.attempts
+            max_retries = RetryPolicy.for_task(current_app.tasks[row.task_name]).max_retries
+            status = EdxNodeBBOutbox.FAILED if attempts > max_retries else EdxNodeBBOutbox.PENDING
+            EdxNodeBBOutbox.objects.filter(id=row.id).update(
+                status=status,
+                attempts=attempts,
+                available_at=timezone.now() + timedelta(seconds=deferred.countdown),
+                claimed_by='',
+                processed=timezone.now() if status == EdxNodeBBOutbox.FAILED else None,
+            )
+            if status == EdxNodeBBOutbox.FAILED:
+                save_dead_letter(row.task_name, json.loads(row.args), json.loads(row.kwargs), attempts=attempts)
+
+    def drain(self):
+        """
+        Drains batches until the outbox has no due rows left.
+
+        Returns:
+            int: Number of rows claimed.
+        """
+        drained = 0
+        claimed = self.drain_once()
+        while claimed:
+            drained += claimed
+            claimed = self.drain_once()
+
+        return drained
+
+
+def expire_held_operations(chunk_size=None):
+    """
+    Fails the operations held for longer than OUTBOX_HOLD_TIMEOUT seconds, as their prerequisite is not
+    expected to show up anymore, and saves them to the dead letters so they can be replayed.
+
+    Rows are failed in chunks which are claimed with a token, so a row released meanwhile is left alone.
+
+    Args:
+        chunk_size (int): Rows failed per query.
+
+    Returns:
+        int: Number of operations failed.
+    """
+    hold_timeout = django_settings.EDLY_DISCUSSION_SETTINGS.get('OUTBOX_HOLD_TIMEOUT', DEFAULT_OUTBOX_HOLD_TIMEOUT)
+    chunk_size = chunk_size or DEFAULT_OUTBOX_BATCH_SIZE
+    held_rows = EdxNodeBBOutbox.objects.filter(
+        status=EdxNodeBBOutbox.HELD, created__lt=timezone.now() - timedelta(seconds=hold_timeout)
+    )
+
+    expired = 0
+    row_ids = list(held_rows.order_by('id').values_list('id', flat=True)[:chunk_size])
+    while row_ids:
+        token = uuid.uuid4().hex
+        held_rows.filter(id__in=row_ids).update(
+            status=EdxNodeBBOutbox.FAILED, claimed_by=token, processed=timezone.now()
+        )
+        for row in EdxNodeBBOutbox.objects.filter(claimed_by=token, status=EdxNodeBBOutbox.FAILED).order_by('id'):
+            save_dead_letter(
+                row.task_name, json.loads(row.args), json.loads(row.kwargs),
+                response='Held for longer than {} seconds waiting for {}.'.format(hold_timeout, row.waiting_for),
+                attempts=row.attempts
+            )
+            expired += 1
+        row_ids = list(held_rows.order_by('id').values_list('id', flat=True)[:chunk_size])
+
+    return expired
+
+
+def expire_held_operations_once_in_a_while():
+    """
+    Runs expire_held_operations at most once every HOLD_SWEEP_INTERVAL seconds across all processes, so that
+    the operations held without USE_OUTBOX, where no drainer compacts the outbox, expire as well.
+    """
+    cache = caches[django_settings.EDLY_DISCUSSION_SETTINGS.get('CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+    if cache.add(HOLD_SWEEP_KEY, True, HOLD_SWEEP_INTERVAL):
+        expire_held_operations()
+
+
+def compact_outbox(keep_done, chunk_size=None):
+    """
+    Deletes the rows of operations which were done or failed more than keep_done ago, after expiring the
+    operations held for too long. Failed operations are kept in the dead letters.
+
+    Args:
+        keep_done (timedelta): How long done and failed rows are kept.
+        chunk_size (int): Rows deleted per query.
+
+    Returns:
+        int: Number of rows deleted.
+    """
+    expire_held_operations(chunk_size)
+
+    chunk_size = chunk_size or DEFAULT_OUTBOX_BATCH_SIZE
+    old_done_rows = EdxNodeBBOutbox.objects.filter(
+        status__in=[EdxNodeBBOutbox.DONE, EdxNodeBBOutbox.FAILED], processed__lt=timezone.now() - keep_done
+    )
+
+    deleted = 0
+    row_ids = list(old_done_rows.values_list('id', flat=True)[:chunk_size])
+    while row_ids:
+        deleted += EdxNodeBBOutbox.objects.filter(id__in=row_ids).delete()[0]
+        row_ids = list(old_done_rows.values_list('id', flat=True)[:chunk_size])
+
+    return deleted
@@ -0,0 +1,114 @@
+"""
+Provisions an edX course on NodeBB: its category, its group and the privileges of the group on the category.
+
+The next step of every course is saved in EdxNodeBBCourseProvisioning, so a retried or resumed run
+starts from the first step which has not succeeded yet.
+"""
+import json
+
+from opaque_keys.edx.locator import CourseLocator
+from openedx.features.openedx_edly_discussion.client.categories import NodeBBCategory
+from openedx.features.openedx_edly_discussion.client.constants import LIVE_PRIORITY
+from openedx.features.openedx_edly_discussion.client.groups import NodeBBGroup
+from openedx.features.openedx_edly_discussion.client.utils import CourseMapping
+from openedx.features.openedx_edly_discussion.models import EdxNodeBBCourseProvisioning
+
+
+class CourseProvisioner(object):
+    """
+    Runs the pending provisioning steps of one course in order, stopping at the first one which fails.
+    """
+
+    def __init__(self, course_data, priority=LIVE_PRIORITY, deadline=None):
+        """
+        Args:
+            course_data (dictionary): Data of the course containing organization, course_name, course_run
+                and display_name.
+            priority (str): LIVE_PRIORITY or BULK_PRIORITY depending on where the work comes from.
+            deadline (float): Timestamp by which the NodeBB calls must finish.
+        """
+        self.course_data = course_data
+        self.course_id = CourseLocator(
+            course_data['organization'], course_data['course_name'], course_data['course_run']
+        )
+        self.nodebb_category = NodeBBCategory(priority=priority, deadline=deadline)
+        self.nodebb_group = NodeBBGroup(priority=priority, deadline=deadline)
+        self.course_mapping = None
+        self.steps = {
+            EdxNodeBBCourseProvisioning.CATEGORY: self.create_category,
+            EdxNodeBBCourseProvisioning.GROUP: self.create_group,
+            EdxNodeBBCourseProvisioning.DEFAULT_PERMISSIONS: self.delete_default_permissions,
+            EdxNodeBBCourseProvisioning.GROUP_PERMISSION: self.add_course_group_permission,
+        }
+
+    @property
+    def group_name(self):
+        return '{}-{}-{}-{}'.format(self.course_data['display_name'], self.course_data['organization'],
+                                    self.course_data['course_name'], self.course_data['course_run'])
+
+    @property
+    def http_time(self):
+        return self.nodebb_category.http_time + self.nodebb_group.http_time
+
+    def create_category(self):
+        if self.course_mapping.cid:
+            return 200, None
+
+        response_code, json_response = self.nodebb_category.create(
+            self.course_id, name=self.course_data['display_name']
+        )
+        if response_code == 200:
+            self.course_mapping.cid = json_response['cid']
+
+        return response_code, json_response
+
+    def create_group(self):
+        if self.course_mapping.slug:
+            return 200, None
+
+        response_code, json_response = self.nodebb_group.create(self.course_id, name=self.group_name)
+        if response_code == 200:
+            self.course_mapping.slug, self.course_mapping.name = json_response['slug'], json_response['name']
+
+        return response_code, json_response
+
+    def delete_default_permissions(self):
+        return self.nodebb_category.delete_default_permissions(self.course_mapping.cid)
+
+    def add_course_group_permission(self):
+        return self.nodebb_category.add_course_group_permission(self.course_mapping.cid, self.course_mapping.name)
+
+    def run(self):
+        """
+        Runs the pending steps of the course and saves the progress after each of them.
+
+        A course without a category starts over from its first step, whatever its saved step says.
+
+        Returns:
+            tuple: Tuple in the form (response_code, json_response) of the step which failed, or of the last
+                step if all of them succeeded.
+        """
+        provisioning, _ = EdxNodeBBCourseProvisioning.objects.get_or_create(
+            course_key=self.course_id, defaults={'display_name': self.course_data['display_name']}
+        )
+        self.course_mapping = CourseMapping.load(course_id=self.course_id) or CourseMapping(self.course_id)
+        if not self.course_mapping.cid:
+            provisioning.step = EdxNodeBBCourseProvisioning.CATEGORY
+
+        response_code, json_response = 200, None
+        while provisioning.step != EdxNodeBBCourseProvisioning.DONE:
+            response_code, json_response = self.steps[provisioning.step]()
+            provisioning.last_status_code = response_code
+            if response_code != 200:
+                provisioning.attempts += 1
+                # Responses may hold non ascii names and errors are not serializable, repr keeps both safe.
+                provisioning.last_response = json.dumps(json_response, default=repr)
+                provisioning.save()
+                break
+
+            steps = EdxNodeBBCourseProvisioning.STEPS
+            provisioning.step = steps[steps.index(provisioning.step) + 1]
+            provisioning.last_response = ''
+            provisioning.save()
+
+        return response_code, json_response
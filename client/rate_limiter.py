@@ -0,0 +1,102 @@
+"""
+Rate limiter for the NodeBB client, budgets are kept in the Django cache so that they are shared by all workers.
+"""
+import time
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from openedx.features.openedx_edly_discussion.client.constants import (
+    BULK_PRIORITY,
+    DEFAULT_CACHE_ALIAS,
+    DEFAULT_RATE_LIMIT_BACKOFF,
+    DEFAULT_RATE_LIMIT_BULK_SHARE,
+    DEFAULT_RATE_LIMIT_MAX_WAIT
+)
+
+TOKENS_KEY = 'edly_discussion:rate_limit:{}:{}'
+BACKOFF_KEY = 'edly_discussion:rate_limit:{}:backoff'
+
+
+class RateLimiter(object):
+    """
+    Token bucket per endpoint class (users, groups, categories) refilled every second.
+
+    RATE_LIMITS maps an endpoint class, or 'default', to the calls per second allowed across all
+    workers. Bulk traffic may only spend RATE_LIMIT_BULK_SHARE of each second's tokens, the rest is
+    kept for live traffic. A 429 from NodeBB pauses the whole endpoint class for a while.
+    """
+
+    def __init__(self):
+        edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+        self.cache = caches[edly_settings.get('CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+        self.rates = edly_settings.get('RATE_LIMITS') or {}
+        self.bulk_share = edly_settings.get('RATE_LIMIT_BULK_SHARE', DEFAULT_RATE_LIMIT_BULK_SHARE)
+        self.max_wait = edly_settings.get('RATE_LIMIT_MAX_WAIT', DEFAULT_RATE_LIMIT_MAX_WAIT)
+        self.backoff_time = edly_settings.get('RATE_LIMIT_BACKOFF', DEFAULT_RATE_LIMIT_BACKOFF)
+
+    def _take_token(self, endpoint_class, priority):
+        """
+        Returns:
+            float: 0 if a token was taken, otherwise seconds to wait before trying again.
+        """
+        now = time.time()
+        backoff_until = self.cache.get(BACKOFF_KEY.format(endpoint_class))
+        if backoff_until and backoff_until > now:
+            return backoff_until - now
+
+        rate = self.rates.get(endpoint_class, self.rates.get('default'))
+        if not rate:
+            return 0
+
+        second = int(now)
+        key = TOKENS_KEY.format(endpoint_class, second)
+        self.cache.add(key, 0, 2)
+        try:
+            used = self.cache.incr(key)
+        except ValueError:
+            return 0
+
+        limit = max(int(rate * self.bulk_share), 1) if priority == BULK_PRIORITY else rate
+        if used <= limit:
+            return 0
+
+        self.cache.decr(key)
+        return second + 1 - now
+
+    def acquire(self, endpoint_class, priority, deadline=None):
+        """
+        Takes a token for a call, waiting up to RATE_LIMIT_MAX_WAIT seconds for one.
+
+        Args:
+            endpoint_class (str): Class of the endpoint being called like users, groups or categories.
+            priority (str): LIVE_PRIORITY or BULK_PRIORITY.
+            deadline (float): Timestamp after which the caller can not wait anymore.
+
+        Returns:
+            bool: True if the call may be sent.
+        """
+        give_up_at = time.time() + self.max_wait
+        if deadline is not None:
+            give_up_at = min(give_up_at, deadline)
+        while True:
+            wait = self._take_token(endpoint_class, priority)
+            if not wait:
+                return True
+            if time.time() + wait > give_up_at:
+                return False
+            time.sleep(wait)
+
+    def backoff(self, endpoint_class, retry_after=None):
+        """
+        Stops all calls of an endpoint class after NodeBB answered with a 429.
+
+        Args:
+            endpoint_class (str): Class of the endpoint which was throttled.
+            retry_after (str): Value of the Retry-After header if NodeBB sent one.
+        """
+        try:
+            backoff_time = int(retry_after)
+        except (TypeError, ValueError):
+            backoff_time = self.backoff_time
+
+        self.cache.set(BACKOFF_KEY.format(endpoint_class), time.time() + backoff_time, backoff_time)
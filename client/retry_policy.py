@@ -0,0 +1,86 @@
+"""
+Retry policies of the NodeBB sync tasks, configured per task family with RETRY_POLICIES in
+EDLY_DISCUSSION_SETTINGS, e.g. {'membership': {'max_retries': 5, 'cap': 1800}}.
+
+The retry budget of every family is kept in the Django cache so that it is shared by all workers.
+"""
+import random
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from openedx.features.openedx_edly_discussion.client.constants import (
+    DEFAULT_CACHE_ALIAS,
+    DEFAULT_RETRY_BUDGET_WINDOW,
+    DEFAULT_RETRY_POLICY
+)
+
+DEFAULT_FAMILY = 'default'
+RETRY_BUDGET_KEY = 'edly_discussion:retry_budget:{}'
+
+
+class RetryPolicy(object):
+    """
+    Exponential backoff with full jitter and a retry budget for one family of tasks.
+
+    max_retries: retries of an operation before it is moved to the dead letters.
+    base, cap: the n-th retry waits a random time between 0 and min(cap, base * 2 ** n) seconds.
+    budget: retries allowed to the whole family within RETRY_BUDGET_WINDOW seconds, None for no limit.
+        Retries beyond the budget are not sent, so that a failing NodeBB is not flooded with them.
+    """
+
+    def __init__(self, family=DEFAULT_FAMILY):
+        edly_settings = django_settings.EDLY_DISCUSSION_SETTINGS
+        retry_policies = edly_settings.get('RETRY_POLICIES', {})
+        policy = dict(DEFAULT_RETRY_POLICY, **retry_policies.get(DEFAULT_FAMILY, {}))
+        policy.update(retry_policies.get(family, {}))
+
+        self.family = family
+        self.max_retries = policy['max_retries']
+        self.base = policy['base']
+        self.cap = policy['cap']
+        self.budget = policy['budget']
+        self.budget_window = edly_settings.get('RETRY_BUDGET_WINDOW', DEFAULT_RETRY_BUDGET_WINDOW)
+        self.cache = caches[edly_settings.get('CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+
+    @classmethod
+    def for_task(cls, task):
+        """
+        Args:
+            task (Task): Celery task, its retry_family attribute names its family.
+
+        Returns:
+            RetryPolicy: Policy of the family of the task.
+        """
+        return cls(getattr(task, 'retry_family', None) or DEFAULT_FAMILY)
+
+    def backoff(self, retries):
+        """
+        Args:
+            retries (int): Retries the operation has already spent.
+
+        Returns:
+            float: Seconds to wait before the next retry.
+        """
+        return random.uniform(0, min(self.cap, self.base * 2 ** retries))
+
+    def is_exhausted(self, retries):
+        return retries >= self.max_retries
+
+    def spend_budget(self):
+        """
+        Takes one retry out of the budget of the family.
+
+        Returns:
+            bool: True if the budget allowed the retry.
+        """
+        if self.budget is None:
+            return True
+
+        key = RETRY_BUDGET_KEY.format(self.family)
+        self.cache.add(key, 0, self.budget_window)
+        try:
+            spent = self.cache.incr(key)
+        except ValueError:
+            spent = 1
+
+        return spent <= self.budget
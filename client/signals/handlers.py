@@ -3,11 +3,28 @@ Contains signals, responsible to sync edX with NodeBB.
 As some related event is occurred in edX the signal is received
 and a relevant request is made to NodeBB write api to make that
 change at NodeBB side too.
+
+Tasks are dispatched once the transaction of the event is committed,
+see client/dispatch.py. Every task is stamped with event_time, the time
+of the event, to measure how long the event takes to reach NodeBB.
 """
+import time
+from functools import partial
+
+from celery.signals import worker_process_init
+from django.conf import settings as django_settings
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_delete
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+from openedx.features.openedx_edly_discussion.client.coalescing import MembershipCoalescer
+from openedx.features.openedx_edly_discussion.client.dispatch import dispatch
+from openedx.features.openedx_edly_discussion.client.outbox import (
+    COURSE_DEPENDENCY,
+    USER_DEPENDENCY,
+    release_held_operations
+)
 from openedx.features.openedx_edly_discussion.client.tasks import (
     task_create_category_on_nodebb,
     task_create_user_on_nodebb,
@@ -17,7 +34,18 @@ from openedx.features.openedx_edly_discussion.client.tasks import (
     task_unjoin_group_on_nodebb,
     task_update_user_profile_on_nodebb
 )
-from openedx.features.openedx_edly_discussion.models import EdxNodeBBCategory
+from openedx.features.openedx_edly_discussion.client.utils import (
+    get_changed_profile_fields,
+    get_nodebb_uid_from_username,
+    invalidate_course_identity,
+    invalidate_user_identity,
+    warm_identity_cache
+)
+from openedx.features.openedx_edly_discussion.models import (
+    EdxNodeBBCategory,
+    EdxNodeBBCourseProvisioning,
+    EdxNodeBBUser
+)
 from student.models import CourseEnrollment, UserProfile
 
 
@@ -25,7 +53,7 @@ from student.models import CourseEnrollment, UserProfile
 def create_and_update_user_on_nodebb(sender, instance, created, update_fields, **kwargs):
     """
     Creates a new user at Nodebb side when a new user is created at edX side. OR
-    Update the previous one if some relevant changes occur.
+    Update the previous one if its email is changed.
 
     Args:
         sender (str): Name of Sender model
@@ -38,9 +66,17 @@ def create_and_update_user_on_nodebb(sender, instance, created, update_fields, *
         user_data = {
             'username': instance.username,
             'email': instance.email,
-            'joindate': instance.date_joined.strftime('%s')
+            'joindate': instance.date_joined.strftime('%s'),
+            'event_time': time.time()
         }
-        task_create_user_on_nodebb.delay(**user_data)
+        dispatch(task_create_user_on_nodebb, kwargs=user_data)
+    elif update_fields is None or 'email' in update_fields:
+        changed_data = get_changed_profile_fields(instance, {'email': instance.email}, synced_users_only=True)
+        if changed_data:
+            dispatch(
+                task_update_user_profile_on_nodebb,
+                kwargs=dict(changed_data, username=instance.username, event_time=time.time())
+            )
 
 
 @receiver(post_save, sender=UserProfile)
@@ -49,6 +85,8 @@ def update_user_profile_on_nodebb(sender, instance, **kwargs):
     If some changed occurs in the User Profile, makes sure that
     these changes are also made at Nodebb side.
 
+    Only the fields which differ from the ones last synced to NodeBB are sent.
+
     Args:
         sender (str): Name of Sender model
         instance: Newly created or updated entry of Model.
@@ -61,7 +99,12 @@ def update_user_profile_on_nodebb(sender, instance, **kwargs):
             instance.city, instance.country.name),
         'birthday': '01/01/{}'.format(instance.year_of_birth)
     }
-    task_update_user_profile_on_nodebb.delay(username=user.username, **user_data)
+    changed_data = get_changed_profile_fields(user, user_data)
+    if changed_data:
+        dispatch(
+            task_update_user_profile_on_nodebb,
+            kwargs=dict(changed_data, username=user.username, event_time=time.time())
+        )
 
 
 @receiver(pre_delete, sender=User)
@@ -69,12 +112,22 @@ def delete_user_from_nodebb(sender, instance, **kwargs):
     """
     Deletes the user from NodeBB if it is deleted from edX.
 
+    The NodeBB uid is resolved right away, as the task is sent once the deletion is committed, when the
+    mapping of the user is deleted along with it.
+
     Args:
         sender (str): Name of Sender model
         instance: Entry of model which is being deleted.
         **kwargs:  All remaining fields.
     """
-    task_delete_user_from_nodebb.delay(username=instance.username)
+    dispatch(
+        task_delete_user_from_nodebb,
+        kwargs={
+            'username': instance.username,
+            'nodebb_uid': get_nodebb_uid_from_username(instance.username),
+            'event_time': time.time()
+        }
+    )
 
 
 @receiver(post_save, sender=CourseOverview)
@@ -94,9 +147,10 @@ def create_category_on_nodebb(sender, instance, created, update_fields, **kwargs
             'organization': instance.id.org,
             'course_name': instance.id.course,
             'course_run': instance.id.run,
-            'display_name': instance.display_name
+            'display_name': instance.display_name,
+            'event_time': time.time()
         }
-        task_create_category_on_nodebb.delay(**course_data)
+        dispatch(task_create_category_on_nodebb, kwargs=course_data)
 
 
 @receiver(pre_delete, sender=EdxNodeBBCategory)
@@ -110,7 +164,11 @@ def delete_category_from_nodebb(sender, instance, **kwargs):
         **kwargs:  All remaining fields.
     """
     category_id = instance.nodebb_cid
-    task_delete_category_from_nodebb.delay(category_id)
+    EdxNodeBBCourseProvisioning.objects.filter(course_key=instance.course_key).delete()
+    dispatch(
+        task_delete_category_from_nodebb, args=(category_id,),
+        kwargs={'group_slug': instance.nodebb_group_slug, 'event_time': time.time()}
+    )
 
 
 @receiver(post_save, sender=CourseEnrollment)
@@ -118,6 +176,9 @@ def manage_membership_on_nodebb_group(sender, instance, **kwargs):
     """
     Join or un-join course related group based on enrollment status of edX user.
 
+    The task is delayed by the coalescing window, so that only the latest of quick successive
+    enrollment changes of the user reaches NodeBB.
+
     Args:
         sender (str): Name of Sender model
         instance: Newly created or updated entry of Model.
@@ -127,8 +188,90 @@ def manage_membership_on_nodebb_group(sender, instance, **kwargs):
         'organization': instance.course_id.org,
         'course_name': instance.course_id.course,
         'course_run': instance.course_id.run,
+        'event_time': time.time()
     }
     if instance.is_active:
-        task_join_group_on_nodebb.delay(instance.username, **course_data)
+        membership_task = task_join_group_on_nodebb
     elif not instance.is_active and not kwargs['created']:
-        task_unjoin_group_on_nodebb.delay(instance.username, **course_data)
+        membership_task = task_unjoin_group_on_nodebb
+    else:
+        return
+
+    coalescer = MembershipCoalescer()
+    course_data['coalesce_token'] = token = coalescer.new_token()
+    dispatch(
+        membership_task, args=(instance.username,), kwargs=course_data, countdown=coalescer.window,
+        on_commit=partial(coalescer.claim, instance.username, instance.course_id, token)
+    )
+
+
+@receiver(post_save, sender=EdxNodeBBUser)
+@receiver(post_delete, sender=EdxNodeBBUser)
+def invalidate_cached_user_identity(sender, instance, **kwargs):
+    """
+    Drops the cached username and nodebb_uid mappings of a user whenever its relation changes.
+
+    Args:
+        sender (str): Name of Sender model
+        instance: Entry of model which is saved or deleted.
+        **kwargs:  All remaining fields.
+    """
+    invalidate_user_identity(instance)
+
+
+@receiver(post_save, sender=EdxNodeBBCategory)
+@receiver(post_delete, sender=EdxNodeBBCategory)
+def invalidate_cached_course_identity(sender, instance, **kwargs):
+    """
+    Drops the cached category and group mappings of a course whenever its relation changes.
+
+    Args:
+        sender (str): Name of Sender model
+        instance: Entry of model which is saved or deleted.
+        **kwargs:  All remaining fields.
+    """
+    invalidate_course_identity(instance)
+
+
+@receiver(post_save, sender=EdxNodeBBUser)
+def release_operations_waiting_for_user(sender, instance, created, **kwargs):
+    """
+    Releases the membership operations held until the user is created on NodeBB, once the relation is
+    committed.
+
+    Args:
+        sender (str): Name of Sender model
+        instance: Newly created or updated entry of Model.
+        created: Flag will be true if new instance created or false if upgraded.
+        **kwargs:  All remaining fields.
+    """
+    if created:
+        transaction.on_commit(partial(release_held_operations, USER_DEPENDENCY.format(instance.edx_uid.username)))
+
+
+@receiver(post_save, sender=EdxNodeBBCategory)
+def release_operations_waiting_for_course(sender, instance, **kwargs):
+    """
+    Releases the membership operations held until the group of the course is created on NodeBB, once the
+    relation is committed.
+
+    Args:
+        sender (str): Name of Sender model
+        instance: Newly created or updated entry of Model.
+        **kwargs:  All remaining fields.
+    """
+    if instance.nodebb_group_slug:
+        transaction.on_commit(partial(release_held_operations, COURSE_DEPENDENCY.format(instance.course_key)))
+
+
+@receiver(worker_process_init)
+def warm_identity_cache_on_worker_start(**kwargs):
+    """
+    Loads the course mappings into the cache of a new Celery worker process if
+    IDENTITY_CACHE_WARM_UP is enabled.
+
+    Args:
+        **kwargs:  All remaining fields.
+    """
+    if django_settings.EDLY_DISCUSSION_SETTINGS.get('IDENTITY_CACHE_WARM_UP', False):
+        warm_identity_cache()
@@ -0,0 +1,150 @@
+"""
+Measures how long edX events take to reach NodeBB and how old the operations still waiting are.
+
+The signal handlers stamp every task with event_time, the time of the edX event. Once NodeBB acknowledges
+the operation the total lag, the queue wait until the task started and the time spent in NodeBB calls
+are recorded per task through the metrics sink, whose timings give the lag percentiles.
+
+The backlogs are the outbox and dead letter rows, and the Celery queues of the lanes. The age of a Celery
+queue is recorded whenever one of its tasks starts, as queues are consumed in order, while its size is
+read from the broker.
+"""
+import calendar
+import time
+from logging import getLogger
+
+from celery import current_app
+from celery.utils.iso8601 import parse_iso8601
+from django.db.models import Count, Min
+from django.utils import timezone
+from openedx.features.openedx_edly_discussion.client.constants import BULK_PRIORITY, LIVE_PRIORITY
+from openedx.features.openedx_edly_discussion.client.lanes import Lane
+from openedx.features.openedx_edly_discussion.client.metrics import get_metrics_sink
+from openedx.features.openedx_edly_discussion.models import EdxNodeBBDeadLetter, EdxNodeBBOutbox
+
+QUEUE_BACKLOG = 'queue:{}'
+log = getLogger(__name__)
+
+BACKLOGS = {
+    'outbox_pending': EdxNodeBBOutbox.objects.filter(
+        status__in=(EdxNodeBBOutbox.PENDING, EdxNodeBBOutbox.PROCESSING)
+    ),
+    'outbox_held': EdxNodeBBOutbox.objects.filter(status=EdxNodeBBOutbox.HELD),
+    'dead_letters': EdxNodeBBDeadLetter.objects.filter(replayed__isnull=True),
+}
+
+
+def record_sync_lag(task_name, event_time, started_at=None, http_time=None):
+    """
+    Args:
+        task_name (str): Name of the task which synced the event.
+        event_time (float): Timestamp of the edX event, None if the task was not sent by a signal handler.
+        started_at (float): Timestamp at which the task started.
+        http_time (float): Seconds the task spent in NodeBB calls.
+    """
+    metrics = get_metrics_sink()
+    if metrics is None or event_time is None:
+        return
+
+    tags = {'task': task_name}
+    metrics.timing('nodebb.sync.lag', (time.time() - event_time) * 1000, tags)
+    if started_at is not None:
+        metrics.timing('nodebb.sync.queue_wait', (started_at - event_time) * 1000, tags)
+    if http_time is not None:
+        metrics.timing('nodebb.sync.http_time', http_time * 1000, tags)
+
+
+def record_queue_age(queue, event_time, eta=None, started_at=None):
+    """
+    Records how long a task waited in its Celery queue since it was due, i.e. since its edX event or since its
+    eta if it was delayed or retried, as the age of the backlog of the queue.
+
+    Args:
+        queue (str): Routing key the task was delivered with.
+        event_time (float): Timestamp of the oldest edX event the task syncs, None if it was not sent by a
+            signal handler.
+        eta (str): ISO 8601 eta of the task, None if it was due right away.
+        started_at (float): Timestamp at which the task started.
+    """
+    metrics = get_metrics_sink()
+    if metrics is None or event_time is None or not queue:
+        return
+
+    due_at = event_time
+    if eta:
+        eta = parse_iso8601(eta)
+        due_at = max(due_at, calendar.timegm(eta.utctimetuple()) + eta.microsecond / 1e6)
+
+    age = max((started_at or time.time()) - due_at, 0)
+    metrics.gauge('nodebb.sync.backlog_age', age, {'backlog': QUEUE_BACKLOG.format(queue)})
+
+
+def get_queue_sizes():
+    """
+    Returns:
+        dictionary: Number of tasks waiting in the Celery queue of every lane, keyed by QUEUE_BACKLOG of the
+            queue. Queues the broker cannot tell the size of are left out.
+    """
+    queue_sizes = {}
+    with current_app.connection_or_acquire() as connection:
+        for priority in (LIVE_PRIORITY, BULK_PRIORITY):
+            queue = Lane(priority).queue
+            if queue:
+                try:
+                    queue_sizes[QUEUE_BACKLOG.format(queue)] = get_queue_size(connection, queue)
+                except Exception:  # pylint: disable=broad-except
+                    log.warning('Size of the Celery queue {} could not be read from the broker.'.format(queue))
+
+    return queue_sizes
+
+
+def get_queue_size(connection, queue):
+    """
+    Args:
+        connection (Connection): Connection to the broker.
+        queue (str): Name of the Celery queue.
+
+    Returns:
+        int: Number of tasks waiting in the queue.
+    """
+    channel = connection.channel()
+    try:
+        return channel.queue_declare(queue=queue, passive=True)[1]
+    finally:
+        channel.close()
+
+
+def get_backlog_ages():
+    """
+    Returns:
+        dictionary: Tuples in the form (size, age) per backlog, where age is the seconds since the oldest
+            operation of the backlog was stored, 0 if the backlog is empty.
+    """
+    now = timezone.now()
+    backlog_ages = {}
+    for name, queryset in BACKLOGS.items():
+        backlog = queryset.aggregate(size=Count('id'), oldest=Min('created'))
+        age = (now - backlog['oldest']).total_seconds() if backlog['oldest'] else 0
+        backlog_ages[name] = backlog['size'], age
+
+    return backlog_ages
+
+
+def report_backlog_ages():
+    """
+    Sends the size and age of every outbox and dead letter backlog, and the size of every Celery queue, as
+    gauges to the metrics sink. The age of the Celery queues is sent by record_queue_age.
+
+    Returns:
+        tuple: Tuple in the form (backlog_ages, queue_sizes) as returned by get_backlog_ages and get_queue_sizes.
+    """
+    backlog_ages, queue_sizes = get_backlog_ages(), get_queue_sizes()
+    metrics = get_metrics_sink()
+    if metrics is not None:
+        for name, (size, age) in backlog_ages.items():
+            metrics.gauge('nodebb.sync.backlog_size', size, {'backlog': name})
+            metrics.gauge('nodebb.sync.backlog_age', age, {'backlog': name})
+        for name, size in queue_sizes.items():
+            metrics.gauge('nodebb.sync.backlog_size', size, {'backlog': name})
+
+    return backlog_ages, queue_sizes
@@ -2,26 +2,242 @@
 Celery tasks to handle api requests of write api of NodeBB.
 """
 import random
+import time
 from logging import getLogger
 
+from celery import current_app
+from celery.exceptions import Retry
+from celery.signals import task_prerun
 from celery.task import task
 from django.conf import settings
 from opaque_keys.edx.locator import CourseLocator
 from openedx.features.openedx_edly_discussion.client.categories import NodeBBCategory
+from openedx.features.openedx_edly_discussion.client.circuit_breaker import CircuitBreaker
+from openedx.features.openedx_edly_discussion.client.coalescing import MembershipCoalescer
+from openedx.features.openedx_edly_discussion.client.constants import (
+    BULK_PRIORITY,
+    CIRCUIT_OPEN,
+    LIVE_PRIORITY,
+    MAX_RETRIES,
+    TASK_DEADLINE_MARGIN,
+    TIMEOUT_ERROR,
+    TOO_MANY_REQUESTS
+)
+from openedx.features.openedx_edly_discussion.client.dead_letters import save_dead_letter
 from openedx.features.openedx_edly_discussion.client.groups import NodeBBGroup
+from openedx.features.openedx_edly_discussion.client.lanes import send_to_lane
+from openedx.features.openedx_edly_discussion.client.outbox import (
+    COURSE_DEPENDENCY,
+    USER_DEPENDENCY,
+    add_to_outbox,
+    release_held_operations
+)
+from openedx.features.openedx_edly_discussion.client.provisioning import CourseProvisioner
+from openedx.features.openedx_edly_discussion.client.rate_limiter import RateLimiter
+from openedx.features.openedx_edly_discussion.client.retry_policy import RetryPolicy
+from openedx.features.openedx_edly_discussion.client.sync_lag import record_queue_age, record_sync_lag
 from openedx.features.openedx_edly_discussion.client.users import NodeBBUser
 from openedx.features.openedx_edly_discussion.client.utils import (
-    get_category_id_from_course_id,
-    get_group_name_from_course_id,
-    get_group_slug_from_category_id,
-    get_group_slug_from_course_id,
-    get_nodebb_uid_from_username
+    CourseMapping,
+    get_nodebb_uid_from_username,
+    is_user_provisioned
 )
 
-MAX_RETRIES = 3
 log = getLogger(__name__)
 
 
+@task_prerun.connect
+def stamp_task_start(sender=None, args=None, kwargs=None, **extra):
+    """
+    Stamps the request of a task of this module with the time it started, to measure its queue wait, and
+    records the age of the backlog of its queue.
+    """
+    if sender is None or not sender.name.startswith(__name__):
+        return
+
+    sender.request.started_at = time.time()
+    if sender is task_run_batch_on_nodebb:
+        event_times = [operation[2].get('event_time') for operation in (args or [[]])[0]]
+    else:
+        event_times = [(kwargs or {}).get('event_time')]
+
+    event_times = [event_time for event_time in event_times if event_time is not None]
+    record_queue_age(
+        (sender.request.delivery_info or {}).get('routing_key'), min(event_times) if event_times else None,
+        sender.request.eta, sender.request.started_at
+    )
+
+
+def get_task_deadline(caller):
+    """
+    Works out by when the NodeBB calls of a task must finish so the task stays within its time limit.
+
+    Args:
+        caller (method): Task which is making the calls.
+
+    Returns:
+        float: Timestamp of the deadline, None if the task has no time limit.
+    """
+    time_limit, soft_time_limit = getattr(caller.request, 'timelimit', None) or (None, None)
+    limit = soft_time_limit or caller.soft_time_limit or time_limit or caller.time_limit
+    if not limit:
+        return None
+
+    return time.time() + limit - TASK_DEADLINE_MARGIN
+
+
+def load_course_mapping(group_data):
+    """
+    Loads the NodeBB mapping of the course a task is working on with a single lookup.
+
+    Args:
+        group_data (dictionary): Data of the course containing organization, course_name and course_run.
+
+    Returns:
+        CourseMapping: Mapping of the course, without any NodeBB identifiers if the course has no category yet.
+    """
+    course_id = get_course_id(group_data)
+    return CourseMapping.load(course_id=course_id) or CourseMapping(course_id)
+
+
+def get_course_id(group_data):
+    """
+    Args:
+        group_data (dictionary): Data of the course containing organization, course_name and course_run.
+
+    Returns:
+        CourseLocator: Id of the edX course.
+    """
+    return CourseLocator(group_data['organization'], group_data['course_name'], group_data['course_run'])
+
+
+def is_superseded(caller, username, group_data, coalesce_token):
+    """
+    Checks whether a newer membership task of the same user and course was dispatched after this one.
+
+    Args:
+        caller (method): Membership task which is running.
+        username (str): Username of edX User whose membership changes.
+        group_data (dictionary): Data of the course containing organization, course_name and course_run.
+        coalesce_token (str): Token the task was dispatched with, None if it is not coalesced.
+
+    Returns:
+        bool: True if the task must be skipped.
+    """
+    if coalesce_token is None:
+        return False
+
+    course_id = get_course_id(group_data)
+    if MembershipCoalescer().is_latest(username, course_id, coalesce_token):
+        return False
+
+    task_name = caller.name.split('.')[-1]
+    log.info('Skipping: {} task for {}: {}, superseded by a newer one'.format(task_name, course_id, username))
+    return True
+
+
+def hold_until_provisioned(caller, uid, course_mapping, username, kwargs):
+    """
+    Holds a membership task in the outbox until the user and the group of the course exist on NodeBB.
+
+    The prerequisite is checked again once the task is held, in case it was saved in the meantime.
+
+    Args:
+        caller (method): Membership task which is running.
+        uid (int): NodeBB uid of the user, None if the user is not created on NodeBB yet.
+        course_mapping (CourseMapping): Mapping of the course.
+        username (str): Username of edX User whose membership changes.
+        kwargs (dictionary): Keyword arguments of the task.
+
+    Returns:
+        bool: True if the task is held and must stop.
+    """
+    if uid is None:
+        waiting_for = USER_DEPENDENCY.format(username)
+    elif not course_mapping.slug:
+        waiting_for = COURSE_DEPENDENCY.format(course_mapping.course_key)
+    else:
+        return False
+
+    add_to_outbox(caller, args=(username,), kwargs=kwargs, waiting_for=waiting_for)
+    log.info('Holding: {} task for {}, waiting for {}'.format(caller.name.split('.')[-1], username, waiting_for))
+
+    if uid is None:
+        is_ready = is_user_provisioned(username)
+    else:
+        latest_mapping = CourseMapping.load(course_id=course_mapping.course_id)
+        is_ready = bool(latest_mapping and latest_mapping.slug)
+    if is_ready:
+        release_held_operations(waiting_for)
+
+    return True
+
+
+class OperationDeferred(Exception):
+    """
+    Raised instead of re-sending a task when an operation run inline, e.g. drained from the outbox, has to
+    run again later.
+    """
+
+    def __init__(self, countdown, spends_retry=True):
+        super(OperationDeferred, self).__init__(countdown)
+        self.countdown = countdown
+        self.spends_retry = spends_retry
+
+
+def retry_task(caller, status_code=None, response=None):
+    """
+    Retries the current task following the retry policy of its family, spending one of its retries.
+
+    Once the task is out of retries, or the retry budget of its family is spent, it is saved to the dead
+    letters instead. Operations run inline wait for the budget to refill rather than becoming dead letters.
+
+    Args:
+        caller (method): Task which is being retried.
+        status_code (int): Status code of the failed NodeBB call.
+        response (str): Response of the failed NodeBB call.
+    """
+    policy = RetryPolicy.for_task(caller)
+    retries = caller.request.retries or 0
+    if not policy.is_exhausted(retries):
+        if policy.spend_budget():
+            countdown = policy.backoff(retries)
+            if caller.request.get('inline'):
+                raise OperationDeferred(countdown)
+            raise caller.retry(exc=None, countdown=countdown, max_retries=policy.max_retries)
+
+        if caller.request.get('inline'):
+            raise OperationDeferred(policy.budget_window, spends_retry=False)
+        log.warning('Retry budget of {} tasks is spent'.format(policy.family))
+
+    save_dead_letter(
+        caller.name, caller.request.args, caller.request.kwargs, status_code, response, attempts=retries + 1
+    )
+    log.error('Dead letter: {} task with args: {}, kwargs: {}'.format(
+        caller.name.split('.')[-1], caller.request.args, caller.request.kwargs
+    ))
+
+
+def park_task(caller, countdown):
+    """
+    Re-schedules the current task on the queue it came from without spending one of its retries.
+
+    Args:
+        caller (method): Task which is being parked.
+        countdown (float): Seconds after which the task will run again.
+    """
+    if caller.request.get('inline'):
+        raise OperationDeferred(countdown, spends_retry=False)
+
+    caller.apply_async(
+        args=caller.request.args,
+        kwargs=caller.request.kwargs,
+        countdown=countdown,
+        retries=caller.request.retries,
+        routing_key=(caller.request.delivery_info or {}).get('routing_key')
+    )
+
+
 def handle_response(response_details):
     """
     We are presuming here server is always running or it is an ngnix server which will always return some response.
@@ -35,17 +251,39 @@ def handle_response(response_details):
             status_code (int): Api response code through which we will check our status.
             response (str): Received response from Api which we will log.
             entity (str): Can be anything like course_name or username or group_name
+            event_time (float): Optional, timestamp of the edX event which the task syncs.
+            http_time (float): Optional, seconds the task spent in NodeBB calls.
     """
     caller, task_name = response_details['caller'], response_details['task_name']
     job_type, status_code = response_details['job_type'], response_details['status_code']
     response, entity = response_details['response'], response_details['entity']
 
-    if status_code >= 500:
+    if status_code == CIRCUIT_OPEN:
+        """
+        NodeBB is known to be down, park the task until the circuit can be probed again.
+        Jitter spreads the parked tasks so they do not all come back at the same moment.
+        """
+        circuit_breaker = CircuitBreaker()
+        log.warning('Parking: {} task for {}: {}'.format(task_name, job_type, entity))
+        park_task(caller, countdown=circuit_breaker.retry_after() + random.uniform(0, circuit_breaker.recovery_timeout))
+    elif status_code == TOO_MANY_REQUESTS:
+        """
+        NodeBB or our own rate limiter throttled the call, park the task until the budget refills.
+        """
+        log.warning('Throttled: {} task for {}: {}'.format(task_name, job_type, entity))
+        park_task(caller, countdown=random.uniform(1, RateLimiter().backoff_time))
+    elif status_code == TIMEOUT_ERROR:
+        """
+        NodeBB did not answer in time, retry the task like a server error but keep it apart in the logs.
+        """
+        log.warning('Timed out, retrying: {} task for {}: {}'.format(task_name, job_type, entity))
+        retry_task(caller, status_code, response)
+    elif status_code >= 500:
         """
         In case of any internal server error, retry that task again.
         """
         log.warning('Retrying: {} task for {}: {}'.format(task_name, job_type, entity))
-        caller.retry(exc=None, countdown=int(random.uniform(2, 4) ** caller.request.retries))
+        retry_task(caller, status_code, response)
     elif status_code >= 400:
         """
         In case of any unauthorized request we don't need to retry the task so we log error.
@@ -54,17 +292,25 @@ def handle_response(response_details):
                   .format(task_name, job_type, entity, status_code, response))
     elif 200 <= status_code < 300:
         log.info('Success: {} task for {}: {}'.format(task_name, job_type, entity))
+        record_sync_lag(
+            caller.name.split('.')[-1], response_details.get('event_time'),
+            caller.request.get('started_at'), response_details.get('http_time')
+        )
 
 
-@task(max_retries=MAX_RETRIES, routing_key=settings.HIGH_PRIORITY_QUEUE)
-def task_create_user_on_nodebb(**user_data):
+@task(max_retries=MAX_RETRIES, retry_family='users', routing_key=settings.HIGH_PRIORITY_QUEUE)
+def task_create_user_on_nodebb(priority=LIVE_PRIORITY, event_time=None, **user_data):
     """
     Creates user on NodeBB.
 
     Args:
+        priority (str): LIVE_PRIORITY or BULK_PRIORITY depending on where the work comes from.
+        event_time (float): Timestamp of the edX event, stamped by the signal handlers.
         **user_data (dictionary): Contains information of user to be created.
     """
-    status_code, response = NodeBBUser().create(**user_data)
+    deadline = get_task_deadline(task_create_user_on_nodebb)
+    nodebb_user = NodeBBUser(priority=priority, deadline=deadline)
+    status_code, response = nodebb_user.create(**user_data)
 
     response_details = {
         'caller': task_create_user_on_nodebb,
@@ -72,22 +318,28 @@ def task_create_user_on_nodebb(**user_data):
         'job_type': "User",
         'status_code': status_code,
         'response': response,
-        'entity': user_data['username']
+        'entity': user_data['username'],
+        'event_time': event_time,
+        'http_time': nodebb_user.http_time
     }
 
     handle_response(response_details)
 
 
-@task(max_retries=MAX_RETRIES, routing_key=settings.HIGH_PRIORITY_QUEUE)
-def task_update_user_profile_on_nodebb(username, **user_data):
+@task(max_retries=MAX_RETRIES, retry_family='users', routing_key=settings.HIGH_PRIORITY_QUEUE)
+def task_update_user_profile_on_nodebb(username, priority=LIVE_PRIORITY, event_time=None, **user_data):
     """
     Sync user profile on NodeBB.
 
     Args:
         username (str): Username of edX User to be updated.
+        priority (str): LIVE_PRIORITY or BULK_PRIORITY depending on where the work comes from.
+        event_time (float): Timestamp of the edX event, stamped by the signal handlers.
         **user_data (dictionary): Contains information of user to be created.
     """
-    status_code, response = NodeBBUser().update(username=username, **user_data)
+    deadline = get_task_deadline(task_update_user_profile_on_nodebb)
+    nodebb_user = NodeBBUser(priority=priority, deadline=deadline)
+    status_code, response = nodebb_user.update(username=username, **user_data)
 
     response_details = {
         'caller': task_update_user_profile_on_nodebb,
@@ -95,21 +347,27 @@ def task_update_user_profile_on_nodebb(username, **user_data):
         'job_type': "User",
         'status_code': status_code,
         'response': response,
-        'entity': username
+        'entity': username,
+        'event_time': event_time,
+        'http_time': nodebb_user.http_time
     }
 
     handle_response(response_details)
 
 
-@task(max_retries=MAX_RETRIES)
-def task_delete_user_from_nodebb(username):
+@task(max_retries=MAX_RETRIES, retry_family='users')
+def task_delete_user_from_nodebb(username, nodebb_uid=None, event_time=None):
     """
     Deletes user from NodeBB.
 
     Args:
         username (str): Username of edX User to be deleted.
+        nodebb_uid (int): NodeBB uid of the user, resolved before its edX user and mapping were deleted.
+        event_time (float): Timestamp of the edX event, stamped by the signal handlers.
     """
-    status_code, response = NodeBBUser().delete_user(username=username)
+    deadline = get_task_deadline(task_delete_user_from_nodebb)
+    nodebb_user = NodeBBUser(deadline=deadline)
+    status_code, response = nodebb_user.delete_user(username=username, uid=nodebb_uid)
 
     response_details = {
         'caller': task_delete_user_from_nodebb,
@@ -117,220 +375,316 @@ def task_delete_user_from_nodebb(username):
         'job_type': "User",
         'status_code': status_code,
         'response': response,
-        'entity': username
+        'entity': username,
+        'event_time': event_time,
+        'http_time': nodebb_user.http_time
     }
 
     handle_response(response_details)
 
 
-@task(max_retries=MAX_RETRIES)
-def task_create_category_on_nodebb(**course_data):
+@task(max_retries=MAX_RETRIES, retry_family='categories')
+def task_create_category_on_nodebb(priority=LIVE_PRIORITY, event_time=None, **course_data):
     """
-    Creates a category corresponding to an edX course.
-    After successful creation of category also creates a
-    group against that category on NodeBB.
+    Provisions an edX course on NodeBB, i.e. creates its category and group and sets the privileges
+    of the group on the category, in one run when NodeBB allows it.
+
+    Progress is saved after every step so that a retry or the resume_course_provisioning command
+    picks up from the step which failed.
 
     Args:
+        priority (str): LIVE_PRIORITY or BULK_PRIORITY depending on where the work comes from.
+        event_time (float): Timestamp of the edX event, stamped by the signal handlers.
         **course_data (dictionary): Extra data related to course like course full name.
     """
-    payload = {
-        'name': course_data['display_name']
-    }
-
-    course_id = CourseLocator(course_data['organization'], course_data['course_name'], course_data['course_run'])
-    status_code, response = NodeBBCategory().create(course_id, **payload)
+    deadline = get_task_deadline(task_create_category_on_nodebb)
+    provisioner = CourseProvisioner(course_data, priority=priority, deadline=deadline)
+    status_code, response = provisioner.run()
 
     response_details = {
         'caller': task_create_category_on_nodebb,
-        'task_name': "Category Creation",
+        'task_name': "Course Provisioning",
         'job_type': "Course",
         'status_code': status_code,
         'response': response,
-        'entity': course_data['display_name']
+        'entity': course_data['display_name'],
+        'event_time': event_time,
+        'http_time': provisioner.http_time
     }
 
     handle_response(response_details)
-    if status_code == 200:
-        _task_create_group_on_nodebb.delay(**course_data)
 
 
-@task(max_retries=MAX_RETRIES)
-def _task_create_group_on_nodebb(**group_data):
+@task(max_retries=MAX_RETRIES, retry_family='categories')
+def task_delete_category_from_nodebb(category_id, group_slug=None, event_time=None):
     """
-    Creates a group on NodeBB.
+    Deletes category from NodeBB.
 
     Args:
-        **group_data (dictionary): Extra data related to group like course full name.
+        category_id (int): NodeBB cid of category we want to delete.
+        group_slug (str): NodeBB group_slug of the course, passed on as the category row is already deleted.
+        event_time (float): Timestamp of the edX event, stamped by the signal handlers.
     """
-    course_id = CourseLocator(group_data['organization'], group_data['course_name'], group_data['course_run'])
-    payload = {
-        'name': '{}-{}-{}-{}'.format(group_data['display_name'], group_data['organization'],
-                                     group_data['course_name'], group_data['course_run'])
-    }
-    status_code, response = NodeBBGroup().create(course_id, **payload)
+    deadline = get_task_deadline(task_delete_category_from_nodebb)
+    nodebb_category = NodeBBCategory(deadline=deadline)
+    status_code, response = nodebb_category.delete_category(category_id)
 
     response_details = {
-        'caller': _task_create_group_on_nodebb,
-        'task_name': "Group Creation",
-        'job_type': "Group",
+        'caller': task_delete_category_from_nodebb,
+        'task_name': "Category Deletion",
+        'job_type': "Category",
         'status_code': status_code,
         'response': response,
-        'entity': group_data['display_name']
+        'entity': category_id,
+        'event_time': event_time,
+        'http_time': nodebb_category.http_time
     }
 
     handle_response(response_details)
 
     if status_code == 200:
-        _task_delete_default_permission_of_category_on_nodebb.delay(**group_data)
+        send_to_lane(
+            _task_delete_group_from_nodebb, LIVE_PRIORITY, (category_id,),
+            {'group_slug': group_slug, 'event_time': event_time}
+        )
 
 
-@task(max_retries=MAX_RETRIES)
-def _task_delete_default_permission_of_category_on_nodebb(**group_data):
+@task(max_retries=MAX_RETRIES, retry_family='groups')
+def _task_delete_group_from_nodebb(category_id, group_slug=None, event_time=None):
     """
-    Deletes default privileges of category on NodeBB.
+    Deletes group from NodeBB.
 
     Args:
-        **group_data (dictionary): Extra data related to group like course full name.
+        category_id (int): NodeBB cid of category for extracting its related group_slug.
+        group_slug (str): NodeBB group_slug of the course if it is known already.
+        event_time (float): Timestamp of the edX event which deleted the category.
     """
-    course_id = CourseLocator(group_data['organization'], group_data['course_name'], group_data['course_run'])
-    category_id = get_category_id_from_course_id(course_id)
-    status_code, response = NodeBBCategory().delete_default_permissions(category_id)
+    if not group_slug:
+        course_mapping = CourseMapping.load(category_id=category_id)
+        group_slug = course_mapping.slug if course_mapping else None
+    if not group_slug:
+        log.error('Failure: Group Deletion task for Group: no group found for category {}'.format(category_id))
+        return
+
+    deadline = get_task_deadline(_task_delete_group_from_nodebb)
+    nodebb_group = NodeBBGroup(deadline=deadline)
+    status_code, response = nodebb_group.delete_group(group_slug)
 
     response_details = {
-        'caller': _task_delete_default_permission_of_category_on_nodebb,
-        'task_name': "Default Permission Deletion",
+        'caller': _task_delete_group_from_nodebb,
+        'task_name': "Group Deletion",
         'job_type': "Group",
         'status_code': status_code,
         'response': response,
-        'entity': str(course_id)
+        'entity': group_slug,
+        'event_time': event_time,
+        'http_time': nodebb_group.http_time
     }
 
     handle_response(response_details)
 
-    if status_code == 200:
-        _task_add_course_group_permission_of_category_on_nodebb.delay(**group_data)
-
 
-@task(max_retries=MAX_RETRIES)
-def _task_add_course_group_permission_of_category_on_nodebb(**group_data):
+@task(max_retries=MAX_RETRIES, retry_family='membership')
+def task_join_group_on_nodebb(username, priority=LIVE_PRIORITY, coalesce_token=None, event_time=None, **group_data):
     """
-    Add custom group permission of category on NodeBB.
+    Register the user in NodeBB group.
 
     Args:
+        username (str): Username of edX User who is joining group.
+        priority (str): LIVE_PRIORITY or BULK_PRIORITY depending on where the work comes from.
+        coalesce_token (str): Token from MembershipCoalescer, the task is skipped once a newer one is claimed.
+        event_time (float): Timestamp of the edX event, stamped by the signal handlers.
         **group_data (dictionary): Extra data related to group like course full name.
     """
-    course_id = CourseLocator(group_data['organization'], group_data['course_name'], group_data['course_run'])
-    group_name = get_group_name_from_course_id(course_id)
-    category_id = get_category_id_from_course_id(course_id)
-    status_code, response = NodeBBCategory().add_course_group_permission(category_id, group_name)
+    if is_superseded(task_join_group_on_nodebb, username, group_data, coalesce_token):
+        return
+
+    course_mapping = load_course_mapping(group_data)
+    uid = get_nodebb_uid_from_username(username)
+    task_kwargs = dict(group_data, priority=priority, coalesce_token=coalesce_token, event_time=event_time)
+    if hold_until_provisioned(task_join_group_on_nodebb, uid, course_mapping, username, task_kwargs):
+        return
+
+    deadline = get_task_deadline(task_join_group_on_nodebb)
+    nodebb_group = NodeBBGroup(priority=priority, deadline=deadline)
+    status_code, response = nodebb_group.add_member(uid, course_mapping.slug, course_mapping)
 
     response_details = {
-        'caller': _task_add_course_group_permission_of_category_on_nodebb,
-        'task_name': "Adding Category Group Permission",
-        'job_type': "Group",
+        'caller': task_join_group_on_nodebb,
+        'task_name': "Group Membership",
+        'job_type': "Join Group",
         'status_code': status_code,
         'response': response,
-        'entity': str(course_id)
+        'entity': username,
+        'event_time': event_time,
+        'http_time': nodebb_group.http_time
     }
 
     handle_response(response_details)
 
 
-@task(max_retries=MAX_RETRIES)
-def task_delete_category_from_nodebb(category_id):
+@task(max_retries=MAX_RETRIES, retry_family='membership')
+def task_unjoin_group_on_nodebb(username, coalesce_token=None, event_time=None, **group_data):
     """
-    Deletes category from NodeBB.
+    Unregister the user from NodeBB group.
 
     Args:
-        category_id (int): NodeBB cid of category we want to delete.
+        username (str): Username of edX User who is leaving the group.
+        coalesce_token (str): Token from MembershipCoalescer, the task is skipped once a newer one is claimed.
+        event_time (float): Timestamp of the edX event, stamped by the signal handlers.
+        **group_data (dictionary): Extra data related to group like course full name.
     """
-    status_code, response = NodeBBCategory().delete_category(category_id)
+    if is_superseded(task_unjoin_group_on_nodebb, username, group_data, coalesce_token):
+        return
+
+    course_mapping = load_course_mapping(group_data)
+    uid = get_nodebb_uid_from_username(username)
+    task_kwargs = dict(group_data, coalesce_token=coalesce_token, event_time=event_time)
+    if hold_until_provisioned(task_unjoin_group_on_nodebb, uid, course_mapping, username, task_kwargs):
+        return
+
+    deadline = get_task_deadline(task_unjoin_group_on_nodebb)
+    nodebb_group = NodeBBGroup(deadline=deadline)
+    status_code, response = nodebb_group.remove_member(uid, course_mapping.slug, course_mapping)
 
     response_details = {
-        'caller': task_delete_category_from_nodebb,
-        'task_name': "Category Deletion",
-        'job_type': "Category",
+        'caller': task_unjoin_group_on_nodebb,
+        'task_name': "Group Membership",
+        'job_type': "Un join Group",
         'status_code': status_code,
         'response': response,
-        'entity': category_id
+        'entity': username,
+        'event_time': event_time,
+        'http_time': nodebb_group.http_time
     }
 
     handle_response(response_details)
 
-    if status_code == 200:
-        _task_delete_group_from_nodebb.delay(category_id)
 
+def handle_members_responses(caller, response_details, responses):
+    """
+    Handles the responses of a bulk membership task like handle_response.
+
+    Members whose calls were refused by NodeBB are logged, the task is retried, parked or saved to the dead
+    letters with the members whose calls failed on the NodeBB side only.
 
-@task(max_retries=MAX_RETRIES)
-def _task_delete_group_from_nodebb(category_id):
+    Args:
+        caller (method): Bulk membership task which is running.
+        response_details (dictionary): Keys of handle_response besides status_code and response.
+        responses (dictionary): Tuples in the form (response_code, json_response) keyed by uid.
     """
-    Deletes group from NodeBB.
+    retry_uids, refused_uids = [], []
+    for uid, (status_code, response) in sorted(responses.items()):
+        if status_code >= 500 or status_code == TOO_MANY_REQUESTS:
+            retry_uids.append(uid)
+        elif status_code >= 400:
+            refused_uids.append(uid)
+            log.error('Failure: {} task for {}: {}, uid: {}, status_code: {}, response: {}'.format(
+                response_details['task_name'], response_details['job_type'], response_details['entity'], uid,
+                status_code, response
+            ))
+
+    if retry_uids:
+        # Only the members which failed on the NodeBB side are sent again.
+        caller.request.kwargs = dict(caller.request.kwargs or {}, uids=retry_uids)
+        status_code, response = responses[retry_uids[0]]
+    else:
+        status_code, response = 200, None
+
+    handle_response(dict(response_details, status_code=status_code, response=response))
+
+
+@task(max_retries=MAX_RETRIES, retry_family='membership')
+def task_join_group_members_on_nodebb(group_slug, uids, priority=BULK_PRIORITY):
+    """
+    Register many users in a NodeBB group at once.
 
     Args:
-        category_id (int): NodeBB cid of category for extracting its related group_slug.
+        group_slug (str): Slug of the group the users are joining.
+        uids (list): NodeBB uids of the users.
+        priority (str): LIVE_PRIORITY or BULK_PRIORITY depending on where the work comes from.
     """
-    group_slug = get_group_slug_from_category_id(category_id)
-    status_code, response = NodeBBGroup().delete_group(group_slug)
+    deadline = get_task_deadline(task_join_group_members_on_nodebb)
+    nodebb_group = NodeBBGroup(priority=priority, deadline=deadline)
+    responses = nodebb_group.add_members(uids, group_slug)
 
     response_details = {
-        'caller': _task_delete_group_from_nodebb,
-        'task_name': "Group Deletion",
-        'job_type': "Group",
-        'status_code': status_code,
-        'response': response,
-        'entity': group_slug
+        'caller': task_join_group_members_on_nodebb,
+        'task_name': "Group Membership",
+        'job_type': "Join Group",
+        'entity': '{} members of {}'.format(len(uids), group_slug),
+        'http_time': nodebb_group.http_time
     }
 
-    handle_response(response_details)
+    handle_members_responses(task_join_group_members_on_nodebb, response_details, responses)
 
 
-@task(max_retries=MAX_RETRIES)
-def task_join_group_on_nodebb(username, **group_data):
+@task(max_retries=MAX_RETRIES, retry_family='membership')
+def task_unjoin_group_members_on_nodebb(group_slug, uids, priority=BULK_PRIORITY):
     """
-    Register the user in NodeBB group.
+    Unregister many users from a NodeBB group at once.
 
     Args:
-        username (str): Username of edX User who is joining group.
-        **group_data (dictionary): Extra data related to group like course full name.
+        group_slug (str): Slug of the group the users are leaving.
+        uids (list): NodeBB uids of the users.
+        priority (str): LIVE_PRIORITY or BULK_PRIORITY depending on where the work comes from.
     """
-    course_id = CourseLocator(group_data['organization'], group_data['course_name'], group_data['course_run'])
-    group_slug = get_group_slug_from_course_id(course_id)
-    uid = get_nodebb_uid_from_username(username)
-    status_code, response = NodeBBGroup().add_member(uid, group_slug)
+    deadline = get_task_deadline(task_unjoin_group_members_on_nodebb)
+    nodebb_group = NodeBBGroup(priority=priority, deadline=deadline)
+    responses = nodebb_group.remove_members(uids, group_slug)
 
     response_details = {
-        'caller': task_join_group_on_nodebb,
+        'caller': task_unjoin_group_members_on_nodebb,
         'task_name': "Group Membership",
-        'job_type': "Join Group",
-        'status_code': status_code,
-        'response': response,
-        'entity': username
+        'job_type': "Un join Group",
+        'entity': '{} members of {}'.format(len(uids), group_slug),
+        'http_time': nodebb_group.http_time
     }
 
-    handle_response(response_details)
+    handle_members_responses(task_unjoin_group_members_on_nodebb, response_details, responses)
 
 
-@task(max_retries=MAX_RETRIES)
-def task_unjoin_group_on_nodebb(username, **group_data):
+def run_operation(task_name, args, kwargs, **request):
     """
-    Unregister the user from NodeBB group.
+    Runs a task in the current process with a request of its own.
 
     Args:
-        username (str): Username of edX User who is leaving the group.
-        **group_data (dictionary): Extra data related to group like course full name.
+        task_name (str): Name of the task.
+        args (list): Positional arguments of the task.
+        kwargs (dictionary): Keyword arguments of the task.
+        **request: Attributes of the request like is_eager, delivery_info, inline, retries or started_at, which
+            defaults to now.
     """
-    course_id = CourseLocator(group_data['organization'], group_data['course_name'], group_data['course_run'])
-    group_slug = get_group_slug_from_course_id(course_id)
-    uid = get_nodebb_uid_from_username(username)
-    status_code, response = NodeBBGroup().remove_member(uid, group_slug)
+    operation_task = current_app.tasks[task_name]
+    request.setdefault('started_at', time.time())
+    operation_task.push_request(args=args, kwargs=kwargs, called_directly=False, **request)
+    try:
+        operation_task.run(*args, **kwargs)
+    finally:
+        operation_task.pop_request()
 
-    response_details = {
-        'caller': task_unjoin_group_on_nodebb,
-        'task_name': "Group Membership",
-        'job_type': "Un join Group",
-        'status_code': status_code,
-        'response': response,
-        'entity': username
-    }
 
-    handle_response(response_details)
+@task()
+def task_run_batch_on_nodebb(operations):
+    """
+    Runs the tasks dispatched within one transaction in a single worker run.
+
+    Every operation runs with a request of its own, so an operation which has to be retried or parked
+    is sent again as an individual task, on the lane of the batch, while the rest of the batch goes on.
+
+    Args:
+        operations (list): Operations in the form (task_name, args, kwargs).
+    """
+    request = task_run_batch_on_nodebb.request
+    # The queue wait of an operation ends when the batch starts, not when the operations before it are done.
+    started_at = request.get('started_at') or time.time()
+    for task_name, args, kwargs in operations:
+        try:
+            run_operation(
+                task_name, args, kwargs,
+                is_eager=request.is_eager, delivery_info=request.delivery_info, started_at=started_at
+            )
+        except Retry:
+            pass
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Failure: {} operation of a batch with args: {}, kwargs: {}'.format(task_name, args, kwargs))
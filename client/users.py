@@ -6,8 +6,10 @@ Contains the User Class for NodeBB Client
 from __future__ import unicode_literals
 
 from openedx.features.openedx_edly_discussion.client import Client
+from openedx.features.openedx_edly_discussion.client.constants import NOT_FOUND
 from openedx.features.openedx_edly_discussion.client.utils import (
     get_nodebb_uid_from_username,
+    save_synced_profile,
     save_user_relation_into_db
 )
 
@@ -31,13 +33,29 @@ class NodeBBUser(Client):
                 joindate (secs): "215518413254"
             }
 
+        The create is idempotent: a user which is mapped already is not created again, and a user which
+        NodeBB has already although the call failed, e.g. created by an attempt whose answer was lost,
+        is adopted.
+
         Returns:
             tuple: Tuple in the form (response_code, json_response) received from requests call.
 
         """
+        username = payload['username']
+        uid = get_nodebb_uid_from_username(username)
+        if uid is not None:
+            return 200, {'uid': uid}
+
         response_code, json_response = self.post('/api/v2/users', **payload)
         if response_code == 200:
-            save_user_relation_into_db(username=payload['username'], nodebb_uid=json_response['uid'])
+            save_user_relation_into_db(username=username, nodebb_uid=json_response['uid'])
+            save_synced_profile(username, {'email': payload['email']})
+        elif self.may_exist_already(response_code):
+            lookup_code, nodebb_user = self.get_user(username, use_cache=False)
+            if lookup_code == 200 and nodebb_user.get('uid'):
+                save_user_relation_into_db(username=username, nodebb_uid=nodebb_user['uid'])
+                save_synced_profile(username, {'email': nodebb_user.get('email')})
+                return 200, {'uid': nodebb_user['uid']}
 
         return response_code, json_response
 
@@ -66,10 +84,16 @@ class NodeBBUser(Client):
 
         """
         uid = get_nodebb_uid_from_username(username)
+        profile_data = dict(payload)
         payload.update({'_uid': uid})
-        return self.put('/api/v2/users/{}'.format(uid), **payload)
+        response_code, json_response = self.put('/api/v2/users/{}'.format(uid), **payload)
+        if response_code == 200:
+            save_synced_profile(username, profile_data)
+            self.forget('/api/user/username/{}'.format(username))
+
+        return response_code, json_response
 
-    def delete_user(self, username):
+    def delete_user(self, username, uid=None):
         """
         Removes the associated NodeBB user.
 
@@ -78,10 +102,32 @@ class NodeBBUser(Client):
 
         Args:
             username (str): The edX username for the user we are deleting.
+            uid (int): NodeBB uid of the user, looked up from username if not given.
 
         Returns:
             tuple: Tuple in the form (response_code, json_response) received from requests call.
 
         """
-        uid = get_nodebb_uid_from_username(username)
-        return self.delete('/api/v2/users/{}'.format(uid), **{'_uid': uid})
+        uid = uid or get_nodebb_uid_from_username(username)
+        if uid is None:
+            return NOT_FOUND, 'User {} is not on NodeBB, no request was made.'.format(username)
+
+        response_code, json_response = self.delete('/api/v2/users/{}'.format(uid), **{'_uid': uid})
+        if response_code == 200:
+            self.forget('/api/user/username/{}'.format(username))
+
+        return response_code, json_response
+
+    def get_user(self, username, use_cache=True):
+        """
+        Fetches the NodeBB user with the given username from the read api.
+
+        Args:
+            username (str): The edX username, NodeBB users carry the same username.
+            use_cache (bool): Set to False to skip the read cache.
+
+        Returns:
+            tuple: Tuple in the form (response_code, json_response) received from requests call.
+
+        """
+        return self.get('/api/user/username/{}'.format(username), use_cache=use_cache)
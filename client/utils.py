@@ -2,13 +2,66 @@
 Contains some common functions of the related app
 to store and retrieve data from database.
 """
+import hashlib
+import json
+import re
+from itertools import islice
+
+from django.conf import settings as django_settings
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from opaque_keys.edx.keys import CourseKey
+from openedx.features.openedx_edly_discussion.client.constants import DEFAULT_BATCH_CHUNK_SIZE
+from openedx.features.openedx_edly_discussion.client.identity_cache import get_identity_cache
 from openedx.features.openedx_edly_discussion.models import EdxNodeBBCategory, EdxNodeBBEnrollment, EdxNodeBBUser
 
+USERNAME_KEY = 'username:{}'
+NODEBB_UID_KEY = 'nodebb_uid:{}'
+COURSE_KEY = 'course:{}'
+CATEGORY_ID_KEY = 'category_id:{}'
+GROUP_SLUG_KEY = 'group_slug:{}'
+
+
+def chunked(iterable, chunk_size=None):
+    """
+    Splits an iterable into lists of at most chunk_size items without loading it all in memory.
+
+    Args:
+        iterable (iterable): Keys to split, can be a generator or a queryset iterator.
+        chunk_size (int): Size of the chunks, BATCH_CHUNK_SIZE of EDLY_DISCUSSION_SETTINGS by default.
+
+    Returns:
+        generator: Lists of consecutive items.
+    """
+    chunk_size = chunk_size or django_settings.EDLY_DISCUSSION_SETTINGS.get(
+        'BATCH_CHUNK_SIZE', DEFAULT_BATCH_CHUNK_SIZE
+    )
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+def slugify_like_nodebb(name):
+    """
+    Builds the slug NodeBB gives to a name: punctuation turns into dashes instead of being dropped
+    like with django's slugify.
+
+    Args:
+        name (str): Name of a NodeBB group.
+
+    Returns:
+        str: Slug of the name.
+    """
+    slug = re.sub(r'[^\w\s-]', '-', name.strip(), flags=re.UNICODE).lower()
+    slug = re.sub(r'-+', '-', re.sub(r'\s+', '-', slug, flags=re.UNICODE))
+    return slug.strip('-')
+
 
 def save_user_relation_into_db(username, nodebb_uid):
     """
-    Saves NodeBB uid against edx_userid in EdxNodeBBUser table.
+    Saves NodeBB uid against edx_userid in EdxNodeBBUser table, updating the row if it exists already.
 
     Args:
         username (str): edX username of user
@@ -17,10 +70,61 @@ def save_user_relation_into_db(username, nodebb_uid):
     edx_user = User.objects.filter(username=username).first()
 
     if edx_user:
-        relation = EdxNodeBBUser()
-        relation.edx_uid = edx_user
-        relation.nodebb_uid = nodebb_uid
-        relation.save()
+        EdxNodeBBUser.objects.update_or_create(edx_uid=edx_user, defaults={'nodebb_uid': nodebb_uid})
+
+
+def get_profile_fingerprint(value):
+    """
+    Args:
+        value: Value of a profile field sent to NodeBB.
+
+    Returns:
+        str: Short digest of the value.
+    """
+    return hashlib.sha1(u'{}'.format(value).encode('utf-8')).hexdigest()[:16]
+
+
+def get_changed_profile_fields(edx_user, profile_data, synced_users_only=False):
+    """
+    Compares profile fields of an edX user with the fields last synced to NodeBB.
+
+    Args:
+        edx_user (User): edX user whose profile is changed.
+        profile_data (dictionary): Profile fields in the form they are sent to NodeBB.
+        synced_users_only (bool): Set to True to get no fields for a user which is not on NodeBB yet, e.g.
+            for fields which the create of the user sends already.
+
+    Returns:
+        dictionary: Fields of profile_data which are not synced to NodeBB yet.
+    """
+    user_relation = EdxNodeBBUser.objects.filter(edx_uid=edx_user).values_list('id', 'synced_profile').first()
+    if user_relation is None and synced_users_only:
+        return {}
+
+    synced_profile = user_relation[1] if user_relation else None
+    fingerprints = json.loads(synced_profile) if synced_profile else {}
+
+    return {
+        field: value for field, value in profile_data.items()
+        if fingerprints.get(field) != get_profile_fingerprint(value)
+    }
+
+
+def save_synced_profile(username, profile_data):
+    """
+    Records the fingerprints of profile fields which are synced to NodeBB.
+
+    Args:
+        username (str): edX username of user
+        profile_data (dictionary): Profile fields which NodeBB has accepted.
+    """
+    user_relation = EdxNodeBBUser.objects.filter(edx_uid__username=username).only('id', 'synced_profile').first()
+
+    if user_relation:
+        fingerprints = json.loads(user_relation.synced_profile) if user_relation.synced_profile else {}
+        fingerprints.update((field, get_profile_fingerprint(value)) for field, value in profile_data.items())
+        synced_profile = json.dumps(fingerprints, sort_keys=True)
+        EdxNodeBBUser.objects.filter(id=user_relation.id).update(synced_profile=synced_profile)
 
 
 def get_nodebb_uid_from_username(username):
@@ -33,26 +137,134 @@ def get_nodebb_uid_from_username(username):
     Returns:
         int: returns nodebb_uid get from model
     """
+    identity_cache = get_identity_cache()
+    nodebb_uid = identity_cache.get(USERNAME_KEY.format(username))
+    if nodebb_uid is not None:
+        return nodebb_uid
+
     user_relation = EdxNodeBBUser.objects.filter(edx_uid__username=username).first()
 
     if user_relation:
+        identity_cache.set(USERNAME_KEY.format(username), user_relation.nodebb_uid)
+        identity_cache.set(NODEBB_UID_KEY.format(user_relation.nodebb_uid), username)
         return user_relation.nodebb_uid
 
     return None
 
 
+def is_user_provisioned(username):
+    """
+    Checks in the database, bypassing the identity cache, whether a user exists on NodeBB.
+
+    Args:
+        username (str): edX username of user
+
+    Returns:
+        bool: True if the user has an EdxNodeBBUser row.
+    """
+    return EdxNodeBBUser.objects.filter(edx_uid__username=username).exists()
+
+
+def get_username_from_nodebb_uid(nodebb_uid):
+    """
+    Extracts edX username from table EdxNodeBBUser using nodebb_uid.
+
+    Args:
+        nodebb_uid (int): NodeBB uid for edx user.
+
+    Returns:
+        str: returns username of the edX user corresponding to nodebb_uid.
+    """
+    identity_cache = get_identity_cache()
+    username = identity_cache.get(NODEBB_UID_KEY.format(nodebb_uid))
+    if username is not None:
+        return username
+
+    username = EdxNodeBBUser.objects.filter(nodebb_uid=nodebb_uid).values_list('edx_uid__username', flat=True).first()
+
+    if username:
+        identity_cache.set(NODEBB_UID_KEY.format(nodebb_uid), username)
+        identity_cache.set(USERNAME_KEY.format(username), nodebb_uid)
+        return username
+
+    return None
+
+
+def get_nodebb_uids_from_usernames(usernames, chunk_size=None):
+    """
+    Extracts nodebb_uids from table EdxNodeBBUser for many usernames, with one query per chunk.
+
+    Args:
+        usernames (iterable): edX usernames of users.
+        chunk_size (int): Number of usernames looked up per query.
+
+    Returns:
+        dict: nodebb_uids keyed by username, usernames without a NodeBB user are left out.
+    """
+    nodebb_uids = {}
+    for chunk in chunked(usernames, chunk_size):
+        nodebb_uids.update(
+            EdxNodeBBUser.objects.filter(edx_uid__username__in=chunk).values_list('edx_uid__username', 'nodebb_uid')
+        )
+
+    return nodebb_uids
+
+
+def get_edx_users_from_nodebb_uids(nodebb_uids, chunk_size=None):
+    """
+    Extracts edx users from table EdxNodeBBUser for many nodebb_uids, with one query per chunk.
+
+    Args:
+        nodebb_uids (iterable): NodeBB uids of edx users.
+        chunk_size (int): Number of nodebb_uids looked up per query.
+
+    Returns:
+        dict: edx users stored in the model keyed by their nodebb_uid.
+    """
+    edx_users = {}
+    for chunk in chunked(nodebb_uids, chunk_size):
+        user_relations = EdxNodeBBUser.objects.filter(nodebb_uid__in=chunk).select_related('edx_uid')
+        edx_users.update((relation.nodebb_uid, relation.edx_uid) for relation in user_relations)
+
+    return edx_users
+
+
+def invalidate_user_identity(user_relation):
+    """
+    Drops the cached mappings of an EdxNodeBBUser row.
+
+    Args:
+        user_relation (EdxNodeBBUser): Row which is saved or deleted.
+    """
+    keys = [NODEBB_UID_KEY.format(user_relation.nodebb_uid)]
+    try:
+        keys.append(USERNAME_KEY.format(user_relation.edx_uid.username))
+    except User.DoesNotExist:
+        pass
+
+    get_identity_cache().delete(*keys)
+
+
 def save_category_relation_into_db(course_id, category_id):
     """
     Saves NodeBB cid against edx_courseid in EdxNodeBBCategory table.
 
+    The row is inserted, never updated, so a cid which is mapped to a course already keeps its mapping.
+
     Args:
         course_id (CourseKey): CourseKey of course for which category is created.
         category_id (int): NodeBB cid for edX course.
+
+    Returns:
+        bool: True if the relation is saved, False if the cid is mapped already.
     """
-    category_relation = EdxNodeBBCategory()
-    category_relation.course_key = course_id
-    category_relation.nodebb_cid = category_id
-    category_relation.save()
+    try:
+        with transaction.atomic():
+            EdxNodeBBCategory.objects.create(course_key=course_id, nodebb_cid=category_id)
+    except IntegrityError:
+        return False
+
+    return True
 
 
 def save_group_relation_into_db(course_id, group_slug, group_name):
@@ -73,112 +285,200 @@ def save_group_relation_into_db(course_id, group_slug, group_name):
         group_relation.save()
 
 
-def get_nodebb_category_relation_from_course_id(course_id):
+class CourseMapping(object):
     """
-    Extracts nodebb_category_relation object from table EdxNodeBBCategory using course_id.
-
-    Args:
-        course_id (CourseKey): Id of edX Course for which cid is required.
-
-    Returns:
-        EdxNodeBBCategory (Model Object): returns object of EdxNodeBBCategory.
+    NodeBB identifiers of an edX course, i.e. its EdxNodeBBCategory row, loaded once per task.
     """
-    category_relation = EdxNodeBBCategory.objects.filter(course_key=course_id).first()
 
-    if category_relation:
-        return category_relation
-
-    return None
-
-
-def get_category_id_from_course_id(course_id):
+    def __init__(self, course_key, cid=None, slug=None, name=None):
+        self.course_key = str(course_key)
+        self.cid = cid
+        self.slug = slug
+        self.name = name
+
+    @property
+    def course_id(self):
+        """
+        Returns:
+            CourseKey: Id of the edX Course.
+        """
+        return CourseKey.from_string(self.course_key)
+
+    @property
+    def is_complete(self):
+        """
+        Returns:
+            bool: True once both the category and the group of the course exist on NodeBB.
+        """
+        return bool(self.cid and self.slug and self.name)
+
+    def to_dict(self):
+        return {'course_key': self.course_key, 'cid': self.cid, 'slug': self.slug, 'name': self.name}
+
+    @classmethod
+    def from_relation(cls, category_relation):
+        return cls(
+            category_relation.course_key,
+            category_relation.nodebb_cid,
+            category_relation.nodebb_group_slug,
+            category_relation.nodebb_group_name
+        )
+
+    @classmethod
+    def load(cls, course_id=None, category_id=None, group_slug=None):
+        """
+        Looks up the mapping of a course by one of course_id, category_id or group_slug.
+
+        Complete mappings are served from and stored in the identity cache.
+
+        Args:
+            course_id (CourseKey): Id of edX Course.
+            category_id (int): nodebb_cid of the course.
+            group_slug (str): NodeBB group_slug of the course.
+
+        Returns:
+            CourseMapping: Mapping of the course, None if the course has no category.
+        """
+        identity_cache = get_identity_cache()
+        if course_id is not None:
+            course_key, lookup = str(course_id), {'course_key': course_id}
+        elif category_id is not None:
+            course_key = identity_cache.get(CATEGORY_ID_KEY.format(category_id))
+            lookup = {'nodebb_cid': category_id}
+        else:
+            course_key = identity_cache.get(GROUP_SLUG_KEY.format(group_slug))
+            lookup = {'nodebb_group_slug': group_slug}
+
+        cached_mapping = identity_cache.get(COURSE_KEY.format(course_key)) if course_key else None
+        if cached_mapping is not None:
+            return cls(**cached_mapping)
+
+        category_relation = EdxNodeBBCategory.objects.filter(**lookup).first()
+        if not category_relation:
+            return None
+
+        mapping = cls.from_relation(category_relation)
+        if mapping.is_complete:
+            mapping.cache()
+
+        return mapping
+
+    @property
+    def cache_entries(self):
+        """
+        Returns:
+            dict: Entries of the mapping in the identity cache, under its course key, category id and group slug.
+        """
+        return {
+            COURSE_KEY.format(self.course_key): self.to_dict(),
+            CATEGORY_ID_KEY.format(self.cid): self.course_key,
+            GROUP_SLUG_KEY.format(self.slug): self.course_key,
+        }
+
+    def cache(self):
+        """
+        Caches the mapping under its course key, category id and group slug.
+        """
+        get_identity_cache().set_many(self.cache_entries)
+
+
+def get_course_mappings(course_ids, chunk_size=None):
     """
-    Extracts nodebb_cid from table EdxNodeBBCategory using course_id.
+    Extracts the mappings of many courses from table EdxNodeBBCategory, with one query per chunk.
 
     Args:
-        course_id (CourseKey): Id of edX Course for which cid is required.
+        course_ids (iterable): CourseKeys of edX courses.
+        chunk_size (int): Number of courses looked up per query.
 
     Returns:
-        int: returns nodebb_cid get from model
+        dict: CourseMapping objects keyed by the course key string, courses without a category are left out.
     """
-    category_relation = EdxNodeBBCategory.objects.filter(course_key=course_id).first()
+    course_mappings = {}
+    for chunk in chunked(course_ids, chunk_size):
+        category_relations = EdxNodeBBCategory.objects.filter(course_key__in=chunk).only(
+            'course_key', 'nodebb_cid', 'nodebb_group_slug', 'nodebb_group_name'
+        )
+        for category_relation in category_relations:
+            course_mapping = CourseMapping.from_relation(category_relation)
+            course_mappings[course_mapping.course_key] = course_mapping
 
-    if category_relation:
-        return category_relation.nodebb_cid
+    return course_mappings
 
-    return None
 
-
-def get_group_slug_from_course_id(course_id):
+def get_course_ids_from_group_slugs(group_slugs, chunk_size=None):
     """
-    Extracts group_slug from table EdxNodeBBCategory using course_id.
+    Extracts course ids from table EdxNodeBBCategory for many group slugs, with one query per chunk.
 
     Args:
-        course_id (CourseKey): Id of edX Course for which group_slug is required.
+        group_slugs (iterable): NodeBB group_slugs of edX courses.
+        chunk_size (int): Number of group_slugs looked up per query.
 
     Returns:
-        str: returns nodebb_group_slug get from model
+        dict: CourseKeys keyed by group_slug, slugs without a course are left out.
     """
-    category_relation = EdxNodeBBCategory.objects.filter(course_key=course_id).first()
-
-    if category_relation:
-        return category_relation.nodebb_group_slug
+    course_ids = {}
+    for chunk in chunked(group_slugs, chunk_size):
+        course_ids.update(
+            EdxNodeBBCategory.objects.filter(nodebb_group_slug__in=chunk).values_list('nodebb_group_slug', 'course_key')
+        )
 
-    return None
+    return course_ids
 
 
-def get_group_slug_from_category_id(category_id):
+def get_course_ids_from_category_ids(category_ids, chunk_size=None):
     """
-    Extracts group_slug from table EdxNodeBBCategory using course_id.
+    Extracts course ids from table EdxNodeBBCategory for many category ids, with one query per chunk.
 
     Args:
-        category_id (int): nodebb_cid for edX Course for which group_slug is required.
+        category_ids (iterable): NodeBB cids of edX courses.
+        chunk_size (int): Number of cids looked up per query.
 
     Returns:
-        str: returns nodebb_group_slug get from model
+        dict: CourseKeys keyed by cid, cids without a course are left out.
     """
-    category_relation = EdxNodeBBCategory.objects.filter(nodebb_cid=category_id).first()
+    course_ids = {}
+    for chunk in chunked(category_ids, chunk_size):
+        course_ids.update(
+            EdxNodeBBCategory.objects.filter(nodebb_cid__in=chunk).values_list('nodebb_cid', 'course_key')
+        )
 
-    if category_relation:
-        return category_relation.nodebb_group_slug
+    return course_ids
 
-    return None
 
-
-def get_group_name_from_course_id(course_id):
+def invalidate_course_identity(category_relation):
     """
-    Extracts group_name from table EdxNodeBBCategory using course_id.
+    Drops the cached mappings of an EdxNodeBBCategory row.
 
     Args:
-      course_id (CourseKey): Id of edX Course for which group_name is required.
-
-    Returns:
-        str: returns nodebb_group_name get from model
+        category_relation (EdxNodeBBCategory): Row which is saved or deleted.
     """
-    category_relation = EdxNodeBBCategory.objects.filter(course_key=course_id).first()
-
-    if category_relation:
-        return category_relation.nodebb_group_name
+    keys = [COURSE_KEY.format(category_relation.course_key), CATEGORY_ID_KEY.format(category_relation.nodebb_cid)]
+    if category_relation.nodebb_group_slug:
+        keys.append(GROUP_SLUG_KEY.format(category_relation.nodebb_group_slug))
 
-    return None
+    get_identity_cache().delete(*keys)
 
 
-def get_course_id_from_group_slug(group_slug):
+def warm_identity_cache(chunk_size=None):
     """
-    Extracts course id from table EdxNodeBBCategory using group_slug.
+    Fills the LRU of the current worker and the shared cache with the mappings of all provisioned courses.
 
-    Args:
-        group_slug (str): NodeBB group_slug for edX course.
+    The LRU entries expire after IDENTITY_CACHE_LOCAL_TTL seconds, the shared entries outlive them for
+    IDENTITY_CACHE_TTL seconds so that the LRU refills from the shared cache instead of the database.
 
-    Returns:
-        CourseKey: returns course_id stored in the model corresponding to group_slug
+    Args:
+        chunk_size (int): Mappings written to the shared cache per call.
     """
-    category_relation = EdxNodeBBCategory.objects.filter(nodebb_group_slug=group_slug).first()
-
-    if category_relation:
-        return category_relation.course_key
+    category_relations = EdxNodeBBCategory.objects.filter(
+        nodebb_group_slug__isnull=False, nodebb_group_name__isnull=False
+    ).only('course_key', 'nodebb_cid', 'nodebb_group_slug', 'nodebb_group_name')
 
-    return None
+    identity_cache = get_identity_cache()
+    for category_relations_chunk in chunked(category_relations.iterator(), chunk_size):
+        entries = {}
+        for category_relation in category_relations_chunk:
+            entries.update(CourseMapping.from_relation(category_relation).cache_entries)
+        identity_cache.set_many(entries)
 
 
 def get_edx_user_from_nodebb_uid(nodebb_uid):
@@ -201,22 +501,16 @@ def get_edx_user_from_nodebb_uid(nodebb_uid):
 
 def save_course_enrollment_in_db(edx_user, course_id, nodebb_cid):
     """
-    Saves edx_user and course_id in EdxNodeBBEnrollment table.
+    Saves edx_user and course_id in EdxNodeBBEnrollment table, updating the row if it exists already.
 
     Args:
         edx_user (User): Edx User to save course enrollment.
         course_id (Course Key): Edx Course Key to save course enrollment.
-        nodebb_cid (EdxNodeBBCategory): EdxNodeBBCategory Object.
+        nodebb_cid (int): nodebb_cid of the EdxNodeBBCategory of the course.
     """
-    course_enrollment = EdxNodeBBEnrollment.objects.filter(edx_uid=edx_user, course_key=course_id,
-                                                           nodebb_cid=nodebb_cid)
-
-    if not course_enrollment:
-        enrollment = EdxNodeBBEnrollment()
-        enrollment.edx_uid = edx_user
-        enrollment.course_key = course_id
-        enrollment.nodebb_cid = nodebb_cid
-        enrollment.save()
+    EdxNodeBBEnrollment.objects.update_or_create(
+        edx_uid=edx_user, course_key=course_id, defaults={'nodebb_cid_id': nodebb_cid}
+    )
 
 
 def remove_course_enrollment_from_db(edx_user, course_id, nodebb_cid):
@@ -226,10 +520,50 @@ def remove_course_enrollment_from_db(edx_user, course_id, nodebb_cid):
     Args:
         edx_user (User): Edx User to delete course enrollment.
         course_id (Course Key): Edx Course Key to delete course enrollment.
-        nodebb_cid (EdxNodeBBCategory): EdxNodeBBCategory Object.
+        nodebb_cid (int): nodebb_cid of the EdxNodeBBCategory of the course.
+    """
+    EdxNodeBBEnrollment.objects.filter(edx_uid=edx_user, course_key=course_id, nodebb_cid_id=nodebb_cid).delete()
+
+
+def save_course_enrollments_in_db(edx_users, course_id, nodebb_cid):
+    """
+    Upserts many edx_users of one course in EdxNodeBBEnrollment table.
+
+    Missing rows are inserted in bulk, rows pointing to another category are updated in one query. If a
+    concurrent worker inserts one of the rows first, the chunk falls back to one upsert per user.
+
+    Args:
+        edx_users (list): Edx Users to save course enrollment.
+        course_id (Course Key): Edx Course Key to save course enrollment.
+        nodebb_cid (int): nodebb_cid of the EdxNodeBBCategory of the course.
     """
-    course_enrollment = EdxNodeBBEnrollment.objects.filter(edx_uid=edx_user, course_key=course_id,
-                                                           nodebb_cid=nodebb_cid)
+    for edx_users_chunk in chunked(edx_users):
+        enrollments = EdxNodeBBEnrollment.objects.filter(edx_uid__in=edx_users_chunk, course_key=course_id)
+        enrolled_user_ids = set(enrollments.values_list('edx_uid_id', flat=True))
+        enrollments.exclude(nodebb_cid_id=nodebb_cid).update(nodebb_cid_id=nodebb_cid)
+
+        new_enrollments = [
+            EdxNodeBBEnrollment(edx_uid=edx_user, course_key=course_id, nodebb_cid_id=nodebb_cid)
+            for edx_user in edx_users_chunk if edx_user.id not in enrolled_user_ids
+        ]
+        try:
+            with transaction.atomic():
+                EdxNodeBBEnrollment.objects.bulk_create(new_enrollments)
+        except IntegrityError:
+            for enrollment in new_enrollments:
+                save_course_enrollment_in_db(enrollment.edx_uid, course_id, nodebb_cid)
+
+
+def remove_course_enrollments_from_db(edx_users, course_id, nodebb_cid):
+    """
+    Deletes course enrollment details of many edx_users of one course from EdxNodeBBEnrollment table.
 
-    if course_enrollment:
-        course_enrollment.delete()
+    Args:
+        edx_users (list): Edx Users to delete course enrollment.
+        course_id (Course Key): Edx Course Key to delete course enrollment.
+        nodebb_cid (int): nodebb_cid of the EdxNodeBBCategory of the course.
+    """
+    for edx_users_chunk in chunked(edx_users):
+        EdxNodeBBEnrollment.objects.filter(
+            edx_uid__in=edx_users_chunk, course_key=course_id, nodebb_cid_id=nodebb_cid
+        ).delete()
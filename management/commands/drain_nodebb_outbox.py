@@ -0,0 +1,44 @@
+"""
+Django management command to run the NodeBB sync operations stored in the outbox.
+"""
+import time
+from datetime import timedelta
+from logging import getLogger
+
+from django.core.management.base import BaseCommand
+from openedx.features.openedx_edly_discussion.client.outbox import OutboxDrainer, compact_outbox
+
+log = getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = """
+    This command drains the outbox filled by the signal handlers when USE_OUTBOX is enabled, and deletes
+    the rows which are done or failed for longer than --keep-done hours, failed operations are kept in the
+    dead letters.
+
+    Example usage:
+        manage.py ... drain_nodebb_outbox --batch-size 200 --concurrency 20 --loop
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows claimed per batch.')
+        parser.add_argument('--concurrency', type=int, help='Operations of a batch run at the same time.')
+        parser.add_argument('--keep-done', type=int, default=24, help='Hours for which done and failed rows are kept.')
+        parser.add_argument('--loop', action='store_true', help='Keep draining until the command is stopped.')
+        parser.add_argument('--sleep', type=float, default=1, help='Seconds to wait when the outbox is empty.')
+
+    def handle(self, *args, **options):
+        drainer = OutboxDrainer(batch_size=options['batch_size'], concurrency=options['concurrency'])
+        keep_done = timedelta(hours=options['keep_done'])
+
+        while True:
+            drained = drainer.drain()
+            compacted = compact_outbox(keep_done)
+            if drained or compacted:
+                log.info('Drained {} outbox rows, compacted {}.'.format(drained, compacted))
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        log.info('Command has been executed.')
@@ -0,0 +1,33 @@
+"""
+Django management command to replay the NodeBB sync operations which ran out of retries.
+"""
+from logging import getLogger
+
+from django.core.management.base import BaseCommand
+from openedx.features.openedx_edly_discussion.client.dead_letters import DeadLetterReplayer
+
+log = getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = """
+    This command replays the dead letters, i.e. the sync operations which ran out of retries while NodeBB
+    was failing. Operations which fail again are kept for the next replay.
+
+    Example usage:
+        manage.py ... replay_nodebb_dead_letters --concurrency 20 --task task_join_group_on_nodebb
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Dead letters replayed per batch.')
+        parser.add_argument('--concurrency', type=int, help='Operations of a batch run at the same time.')
+        parser.add_argument('--task', help='Replay only the dead letters of this task.')
+        parser.add_argument('--limit', type=int, help='Dead letters to replay at most.')
+
+    def handle(self, *args, **options):
+        replayer = DeadLetterReplayer(
+            batch_size=options['batch_size'], concurrency=options['concurrency'], task_name=options['task']
+        )
+        replayed, failed = replayer.replay(limit=options['limit'])
+        log.info('Replayed {} dead letters, {} failed again.'.format(replayed, failed))
+        log.info('Command has been executed.')
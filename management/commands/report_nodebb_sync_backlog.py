@@ -0,0 +1,45 @@
+"""
+Django management command to report the size and age of the NodeBB sync operations still waiting.
+"""
+import time
+from logging import getLogger
+
+from django.core.management.base import BaseCommand
+from openedx.features.openedx_edly_discussion.client.outbox import expire_held_operations
+from openedx.features.openedx_edly_discussion.client.sync_lag import report_backlog_ages
+
+log = getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = """
+    This command reports how many sync operations are waiting in the outbox, held for their user or course,
+    or saved as dead letters, and how old the oldest of each of them is, along with how many tasks are waiting
+    in the Celery queue of every lane. The numbers are logged and sent as gauges to METRICS_SINK so that
+    alerts can be set on them. The age of the Celery queues is sent by the tasks themselves when they start.
+    Operations held for longer than OUTBOX_HOLD_TIMEOUT are failed before every report.
+
+    Example usage:
+        manage.py ... report_nodebb_sync_backlog --loop --sleep 60
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep reporting until the command is stopped.')
+        parser.add_argument('--sleep', type=float, default=60, help='Seconds between two reports.')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_held_operations()
+            if expired:
+                log.info('Expired {} operations held for longer than OUTBOX_HOLD_TIMEOUT.'.format(expired))
+
+            backlog_ages, queue_sizes = report_backlog_ages()
+            for name, (size, age) in sorted(backlog_ages.items()):
+                log.info('Backlog {}: {} operations, oldest is {:.0f} seconds old.'.format(name, size, age))
+            for name, size in sorted(queue_sizes.items()):
+                log.info('Backlog {}: {} tasks.'.format(name, size))
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        log.info('Command has been executed.')
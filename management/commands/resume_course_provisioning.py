@@ -0,0 +1,96 @@
+"""
+Django management command to resume the provisioning of courses which is stuck at some step on NodeBB.
+"""
+from datetime import timedelta
+from itertools import chain
+from logging import getLogger
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+from openedx.features.openedx_edly_discussion.client.constants import BULK_PRIORITY
+from openedx.features.openedx_edly_discussion.client.lanes import send_to_lane
+from openedx.features.openedx_edly_discussion.client.tasks import task_create_category_on_nodebb
+from openedx.features.openedx_edly_discussion.models import EdxNodeBBCategory, EdxNodeBBCourseProvisioning
+
+log = getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = """
+    This command resumes the provisioning of courses on NodeBB which has not completed all of its steps.
+
+    Courses whose category was created before provisioning was tracked but have no group yet are resumed too.
+
+    Example usage:
+        manage.py ... resume_course_provisioning --older-than 30
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=10,
+            help='Only resume courses whose provisioning has not progressed for this many minutes.'
+        )
+
+    def handle(self, *args, **options):
+        untracked_provisionings = self.track_untracked_courses()
+
+        stuck_since = timezone.now() - timedelta(minutes=options['older_than'])
+        stuck_provisionings = EdxNodeBBCourseProvisioning.objects.exclude(
+            step=EdxNodeBBCourseProvisioning.DONE
+        ).filter(modified__lt=stuck_since).only('course_key', 'display_name', 'step', 'modified')
+
+        resumed = 0
+        for provisioning in chain(untracked_provisionings, self.claim(stuck_provisionings.iterator())):
+            course_data = {
+                'organization': provisioning.course_key.org,
+                'course_name': provisioning.course_key.course,
+                'course_run': provisioning.course_key.run,
+                'display_name': provisioning.display_name
+            }
+            send_to_lane(
+                task_create_category_on_nodebb, BULK_PRIORITY, kwargs=dict(course_data, priority=BULK_PRIORITY)
+            )
+            resumed += 1
+
+        log.info('Command has been executed, resumed provisioning of {} courses.'.format(resumed))
+
+    @staticmethod
+    def claim(provisionings):
+        """
+        Touches the modified time of stuck provisionings before they are resumed, so that they are not resumed
+        again, by this or a concurrent run, until they are stuck once more.
+
+        Args:
+            provisionings (iterable): EdxNodeBBCourseProvisioning objects which are stuck.
+
+        Yields:
+            EdxNodeBBCourseProvisioning: Provisionings which are claimed by this run.
+        """
+        for provisioning in provisionings:
+            claimed = EdxNodeBBCourseProvisioning.objects.filter(
+                id=provisioning.id, modified__lte=provisioning.modified
+            ).update(modified=timezone.now())
+            if claimed:
+                yield provisioning
+
+    @staticmethod
+    def track_untracked_courses():
+        """
+        Records the provisioning of courses which have a category but no group and no provisioning row.
+
+        Returns:
+            list: EdxNodeBBCourseProvisioning objects which are created.
+        """
+        tracked_course_keys = EdxNodeBBCourseProvisioning.objects.values('course_key')
+        untracked_course_keys = EdxNodeBBCategory.objects.filter(nodebb_group_slug__isnull=True).exclude(
+            course_key__in=tracked_course_keys
+        ).values_list('course_key', flat=True)
+        display_names = CourseOverview.objects.filter(id__in=untracked_course_keys).values_list('id', 'display_name')
+
+        return EdxNodeBBCourseProvisioning.objects.bulk_create([
+            EdxNodeBBCourseProvisioning(
+                course_key=course_key, display_name=display_name, step=EdxNodeBBCourseProvisioning.GROUP
+            )
+            for course_key, display_name in display_names
+        ])
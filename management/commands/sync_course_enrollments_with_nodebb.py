@@ -1,12 +1,25 @@
 """
 Django management command to join groups at NodeBB corresponding to edX course enrollments.
 """
+from array import array
 from logging import getLogger
 
+from django.conf import settings as django_settings
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
-from openedx.features.openedx_edly_discussion.client.tasks import task_join_group_on_nodebb
-from openedx.features.openedx_edly_discussion.models import EdxNodeBBCategory, EdxNodeBBEnrollment
+from openedx.features.openedx_edly_discussion.client.constants import (
+    BULK_PRIORITY,
+    DEFAULT_COURSE_CHUNK_SIZE,
+    DEFAULT_DISPATCH_BATCH_SIZE
+)
+from openedx.features.openedx_edly_discussion.client.lanes import send_to_lane
+from openedx.features.openedx_edly_discussion.client.tasks import (
+    task_join_group_members_on_nodebb,
+    task_join_group_on_nodebb,
+    task_unjoin_group_members_on_nodebb
+)
+from openedx.features.openedx_edly_discussion.client.utils import chunked
+from openedx.features.openedx_edly_discussion.models import EdxNodeBBCategory, EdxNodeBBEnrollment, EdxNodeBBUser
 from student.models import CourseEnrollment
 
 log = getLogger(__name__)
@@ -14,25 +27,143 @@ log = getLogger(__name__)
 
 class Command(BaseCommand):
     help = """
-    This command creates user membership in groups of NodeBB based on user enrollments in edX courses
+    This command creates user membership in groups of NodeBB based on user enrollments in edX courses,
+    and removes the memberships whose edX enrollment is not active anymore.
+
+    Courses which have a NodeBB group are read --chunk-size courses at a time. For every course, the sorted
+    user ids of its active enrollments and of its synced memberships are read into integer arrays and merged,
+    so only the user ids of one course are held in memory. Missing and stale members are then joined and
+    removed in bulk tasks.
 
     Example usage:
-        manage.py ... sync_course_enrollments_with_nodebb
+        manage.py ... sync_course_enrollments_with_nodebb --chunk-size 10
     """
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Courses read per query.')
+
     def handle(self, *args, **options):
-        enrollments = CourseEnrollment.objects.filter(is_active=True)
-        for enrollment in enrollments:
-            category_relation = EdxNodeBBCategory.objects.filter(course_key=enrollment.course_id)
-            if category_relation:
-                edx_user = User.objects.filter(username=enrollment.username).first()
-                enrollment_relation = EdxNodeBBEnrollment.objects.filter(edx_uid=edx_user, course_key=enrollment.course_id)
-                if not enrollment_relation:
-                    course_data = {
-                        'organization': enrollment.course_id.org,
-                        'course_name': enrollment.course_id.course,
-                        'course_run': enrollment.course_id.run,
-                    }
-                    task_join_group_on_nodebb.delay(enrollment.username, **course_data)
-
-        log.info('Command has been executed.')
+        chunk_size = options['chunk_size'] or DEFAULT_COURSE_CHUNK_SIZE
+        self.members_per_task = django_settings.EDLY_DISCUSSION_SETTINGS.get(
+            'DISPATCH_BATCH_SIZE', DEFAULT_DISPATCH_BATCH_SIZE
+        )
+
+        courses = EdxNodeBBCategory.objects.filter(
+            nodebb_group_slug__isnull=False
+        ).exclude(nodebb_group_slug='').order_by('nodebb_cid').values_list(
+            'nodebb_cid', 'course_key', 'nodebb_group_slug'
+        )
+
+        joined = removed = last_cid = 0
+        while True:
+            courses_chunk = list(courses.filter(nodebb_cid__gt=last_cid)[:chunk_size])
+            if not courses_chunk:
+                break
+
+            for _, course_key, group_slug in courses_chunk:
+                enrolled_user_ids = self.get_user_ids(
+                    CourseEnrollment.objects.filter(course_id=course_key, is_active=True), 'user_id'
+                )
+                member_user_ids = self.get_user_ids(
+                    EdxNodeBBEnrollment.objects.filter(course_key=course_key), 'edx_uid_id'
+                )
+                missing_user_ids, stale_user_ids = self.diff_user_ids(enrolled_user_ids, member_user_ids)
+                joined += self.join_members(course_key, group_slug, missing_user_ids)
+                removed += self.remove_members(group_slug, stale_user_ids)
+
+            last_cid = courses_chunk[-1][0]
+
+        log.info('Command has been executed, joining {} and removing {} members.'.format(joined, removed))
+
+    @staticmethod
+    def get_user_ids(queryset, field):
+        """
+        Args:
+            queryset (QuerySet): Rows of one course.
+            field (str): Field of the rows holding the edX user id.
+
+        Returns:
+            array: User ids of the rows, in ascending order.
+        """
+        return array('l', queryset.order_by(field).values_list(field, flat=True).iterator())
+
+    @staticmethod
+    def diff_user_ids(enrolled_user_ids, member_user_ids):
+        """
+        Merges two sorted arrays of user ids of a course.
+
+        Args:
+            enrolled_user_ids (array): User ids of the active enrollments.
+            member_user_ids (array): User ids of the synced memberships.
+
+        Returns:
+            tuple: Tuple in the form (missing_user_ids, stale_user_ids), the enrolled users who are not members
+                and the members who are not enrolled anymore.
+        """
+        missing_user_ids, stale_user_ids = array('l'), array('l')
+        enrolled_index = member_index = 0
+        while enrolled_index < len(enrolled_user_ids) and member_index < len(member_user_ids):
+            enrolled_user_id, member_user_id = enrolled_user_ids[enrolled_index], member_user_ids[member_index]
+            if enrolled_user_id == member_user_id:
+                enrolled_index += 1
+                member_index += 1
+            elif enrolled_user_id < member_user_id:
+                missing_user_ids.append(enrolled_user_id)
+                enrolled_index += 1
+            else:
+                stale_user_ids.append(member_user_id)
+                member_index += 1
+
+        missing_user_ids.extend(enrolled_user_ids[enrolled_index:])
+        stale_user_ids.extend(member_user_ids[member_index:])
+        return missing_user_ids, stale_user_ids
+
+    def join_members(self, course_key, group_slug, user_ids):
+        """
+        Joins users to the group of a course, in bulk for the users who are on NodeBB already. The others
+        get a task of their own which waits until they are created on NodeBB.
+
+        Returns:
+            int: Number of users joining.
+        """
+        course_data = {
+            'organization': course_key.org,
+            'course_name': course_key.course,
+            'course_run': course_key.run,
+            'priority': BULK_PRIORITY
+        }
+        for user_ids_chunk in chunked(user_ids):
+            nodebb_uids = dict(
+                EdxNodeBBUser.objects.filter(edx_uid_id__in=user_ids_chunk).values_list('edx_uid_id', 'nodebb_uid')
+            )
+            for uids in chunked(sorted(nodebb_uids.values()), self.members_per_task):
+                send_to_lane(
+                    task_join_group_members_on_nodebb, BULK_PRIORITY,
+                    kwargs={'group_slug': group_slug, 'uids': uids, 'priority': BULK_PRIORITY}
+                )
+
+            unmapped_user_ids = [user_id for user_id in user_ids_chunk if user_id not in nodebb_uids]
+            if unmapped_user_ids:
+                for username in User.objects.filter(id__in=unmapped_user_ids).values_list('username', flat=True):
+                    send_to_lane(task_join_group_on_nodebb, BULK_PRIORITY, (username,), course_data)
+
+        return len(user_ids)
+
+    def remove_members(self, group_slug, user_ids):
+        """
+        Removes users whose edX enrollment is not active anymore from the group of a course, in bulk.
+
+        Returns:
+            int: Number of users being removed.
+        """
+        for user_ids_chunk in chunked(user_ids):
+            nodebb_uids = EdxNodeBBUser.objects.filter(edx_uid_id__in=user_ids_chunk).values_list(
+                'nodebb_uid', flat=True
+            )
+            for uids in chunked(sorted(nodebb_uids), self.members_per_task):
+                send_to_lane(
+                    task_unjoin_group_members_on_nodebb, BULK_PRIORITY,
+                    kwargs={'group_slug': group_slug, 'uids': uids, 'priority': BULK_PRIORITY}
+                )
+
+        return len(user_ids)
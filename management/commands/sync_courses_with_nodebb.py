@@ -5,8 +5,10 @@ from logging import getLogger
 
 from django.core.management.base import BaseCommand
 from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+from openedx.features.openedx_edly_discussion.client.constants import BULK_PRIORITY
+from openedx.features.openedx_edly_discussion.client.lanes import send_to_lane
 from openedx.features.openedx_edly_discussion.client.tasks import task_create_category_on_nodebb
-from openedx.features.openedx_edly_discussion.models import EdxNodeBBCategory
+from openedx.features.openedx_edly_discussion.client.utils import chunked, get_course_mappings
 
 log = getLogger(__name__)
 
@@ -20,16 +22,21 @@ class Command(BaseCommand):
     """
 
     def handle(self, *args, **options):
-        edx_courses = CourseOverview.objects.all()
-        nodebb_categories = EdxNodeBBCategory.objects.all()
-        for edx_course in edx_courses:
-            category_relation = nodebb_categories.filter(course_key=edx_course.id)
-            if not category_relation:
+        edx_courses = CourseOverview.objects.only('id', 'display_name').iterator()
+        for edx_courses_chunk in chunked(edx_courses):
+            course_mappings = get_course_mappings(edx_course.id for edx_course in edx_courses_chunk)
+            for edx_course in edx_courses_chunk:
+                if str(edx_course.id) in course_mappings:
+                    continue
+
                 course_data = {
                     'organization': edx_course.id.org,
                     'course_name': edx_course.id.course,
                     'course_run': edx_course.id.run,
                     'display_name': edx_course.display_name
                 }
-                task_create_category_on_nodebb.delay(course_display_name=edx_course.display_name, **course_data)
+                send_to_lane(
+                    task_create_category_on_nodebb, BULK_PRIORITY,
+                    kwargs=dict(course_data, course_display_name=edx_course.display_name, priority=BULK_PRIORITY)
+                )
         log.info('Command has been executed')
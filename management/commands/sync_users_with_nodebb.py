@@ -3,48 +3,80 @@ Django management command to create users at NodeBB corresponding to edX users.
 """
 from logging import getLogger
 
+from django.conf import settings as django_settings
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
+from django_countries.fields import Country
+from openedx.features.openedx_edly_discussion.client.constants import BULK_PRIORITY, DEFAULT_BATCH_CHUNK_SIZE
+from openedx.features.openedx_edly_discussion.client.lanes import send_to_lane
 from openedx.features.openedx_edly_discussion.client.tasks import (
     task_create_user_on_nodebb,
     task_update_user_profile_on_nodebb
 )
-from openedx.features.openedx_edly_discussion.models import EdxNodeBBUser
-from student.models import UserProfile
 
 log = getLogger(__name__)
 
+USER_FIELDS = (
+    'id', 'username', 'email', 'date_joined',
+    'profile__id', 'profile__name', 'profile__city', 'profile__country', 'profile__year_of_birth'
+)
+
 
 class Command(BaseCommand):
     help = """
     This command creates users in NodeBB according to all User and UserProfile instances in edX.
 
+    Users which are not mapped to a NodeBB user yet are read along with their profiles in chunks of
+    --chunk-size rows ordered by id, so the memory used does not grow with the number of users.
+
     Example usage:
-        manage.py ... sync_users_with_nodebb
+        manage.py ... sync_users_with_nodebb --chunk-size 5000
     """
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Users read per query.')
+
     def handle(self, *args, **options):
-        nodebb_relations = EdxNodeBBUser.objects.all()
-        edx_users = User.objects.all()
-        user_profiles = UserProfile.objects.all()
-
-        for edx_user in edx_users:
-            nodebb_user = nodebb_relations.filter(edx_uid=edx_user)
-            if not nodebb_user:
-                user_data = {
-                    'username': edx_user.username,
-                    'email': edx_user.email,
-                    'joindate': edx_user.date_joined.strftime("%s")
-                }
-                task_create_user_on_nodebb.delay(**user_data)
-
-                profile = user_profiles.filter(user=edx_user).first()
-                if profile:
-                    profile_data = {
-                        'fullname': profile.name,
-                        'location': '{}, {}'.format(
-                            profile.city, profile.country.name),
-                        'birthday': '01/01/%s' % profile.year_of_birth
-                    }
-                    task_update_user_profile_on_nodebb.delay(username=edx_user.username, **profile_data)
-        log.info('Command has been executed.')
+        chunk_size = options['chunk_size'] or django_settings.EDLY_DISCUSSION_SETTINGS.get(
+            'BATCH_CHUNK_SIZE', DEFAULT_BATCH_CHUNK_SIZE
+        )
+        unmapped_users = User.objects.filter(edxnodebbuser__isnull=True).order_by('id').values(*USER_FIELDS)
+
+        synced, last_id = 0, 0
+        while True:
+            users_chunk = list(unmapped_users.filter(id__gt=last_id)[:chunk_size].iterator())
+            if not users_chunk:
+                break
+
+            for edx_user in users_chunk:
+                self.sync_user(edx_user)
+            synced += len(users_chunk)
+            last_id = users_chunk[-1]['id']
+
+        log.info('Command has been executed, synced {} users.'.format(synced))
+
+    @staticmethod
+    def sync_user(edx_user):
+        """
+        Sends the tasks which create a user and its profile on NodeBB.
+
+        Args:
+            edx_user (dictionary): Values of USER_FIELDS of an edX user.
+        """
+        user_data = {
+            'username': edx_user['username'],
+            'email': edx_user['email'],
+            'joindate': edx_user['date_joined'].strftime("%s"),
+            'priority': BULK_PRIORITY
+        }
+        send_to_lane(task_create_user_on_nodebb, BULK_PRIORITY, kwargs=user_data)
+
+        if edx_user['profile__id'] is not None:
+            profile_data = {
+                'username': edx_user['username'],
+                'fullname': edx_user['profile__name'],
+                'location': '{}, {}'.format(edx_user['profile__city'], Country(edx_user['profile__country']).name),
+                'birthday': '01/01/%s' % edx_user['profile__year_of_birth'],
+                'priority': BULK_PRIORITY
+            }
+            send_to_lane(task_update_user_profile_on_nodebb, BULK_PRIORITY, kwargs=profile_data)
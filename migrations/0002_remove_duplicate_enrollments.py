@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicate_enrollments(apps, schema_editor):
+    """
+    Keeps the oldest EdxNodeBBEnrollment of every (edx_uid, course_key) pair so that the pair can be made unique.
+    """
+    EdxNodeBBEnrollment = apps.get_model('openedx_edly_discussion', 'EdxNodeBBEnrollment')
+    duplicates = EdxNodeBBEnrollment.objects.values('edx_uid', 'course_key').annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+
+    for duplicate in duplicates.iterator():
+        EdxNodeBBEnrollment.objects.filter(
+            edx_uid=duplicate['edx_uid'], course_key=duplicate['course_key']
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_edly_discussion', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_enrollments, migrations.RunPython.noop),
+    ]
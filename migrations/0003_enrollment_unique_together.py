@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('openedx_edly_discussion', '0002_remove_duplicate_enrollments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='edxnodebbcategory',
+            name='nodebb_group_slug',
+            field=models.SlugField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='edxnodebbenrollment',
+            unique_together=set([('edx_uid', 'course_key')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import opaque_keys.edx.django.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_edly_discussion', '0003_enrollment_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EdxNodeBBCourseProvisioning',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_key', opaque_keys.edx.django.models.CourseKeyField(max_length=255, unique=True)),
+                ('display_name', models.TextField()),
+                ('step', models.CharField(choices=[('category', 'category'), ('group', 'group'), ('default_permissions', 'default_permissions'), ('group_permission', 'group_permission'), ('done', 'done')], db_index=True, default='category', max_length=32)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_status_code', models.IntegerField(blank=True, null=True)),
+                ('last_response', models.TextField(blank=True, default='')),
+                ('modified', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
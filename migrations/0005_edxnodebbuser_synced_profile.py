@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_edly_discussion', '0004_edxnodebbcourseprovisioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edxnodebbuser',
+            name='synced_profile',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
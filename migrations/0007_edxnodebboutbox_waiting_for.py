@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('openedx_edly_discussion', '0006_edxnodebboutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edxnodebboutbox',
+            name='waiting_for',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='edxnodebboutbox',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('processing', 'processing'), ('done', 'done'), ('failed', 'failed'), ('held', 'held')], default='pending', max_length=16),
+        ),
+    ]
@@ -3,15 +3,19 @@ Models to save required data to sync edx with nodebb.
 """
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 from opaque_keys.edx.django.models import CourseKeyField
 
 
 class EdxNodeBBUser(models.Model):
     """
     Stores NodeBB uid against edX User
+
+    synced_profile keeps a JSON fingerprint of every profile field last synced to NodeBB.
     """
     edx_uid = models.OneToOneField(User, on_delete=models.CASCADE)
     nodebb_uid = models.IntegerField(unique=True)
+    synced_profile = models.TextField(blank=True, default='')
 
     def __str__(self):
         return self.edx_uid.username
@@ -23,7 +27,7 @@ class EdxNodeBBCategory(models.Model):
     """
     course_key = CourseKeyField(max_length=255, db_index=True)
     nodebb_cid = models.IntegerField(primary_key=True)
-    nodebb_group_slug = models.SlugField(max_length=255, blank=True, null=True)
+    nodebb_group_slug = models.SlugField(max_length=255, blank=True, null=True, db_index=True)
     nodebb_group_name = models.TextField(blank=True, null=True)
 
     def __str__(self):
@@ -38,5 +42,81 @@ class EdxNodeBBEnrollment(models.Model):
     edx_uid = models.ForeignKey(User, on_delete=models.CASCADE)
     nodebb_cid = models.ForeignKey(EdxNodeBBCategory, on_delete=models.CASCADE)
 
+    class Meta(object):
+        unique_together = ('edx_uid', 'course_key')
+
     def __str__(self):
         return '{}-{}'.format(self.edx_uid.username, str(self.course_key))
+
+
+class EdxNodeBBCourseProvisioning(models.Model):
+    """
+    Stores the next step of provisioning an edX Course on NodeBB, so that failed provisioning can be resumed.
+    """
+    CATEGORY = 'category'
+    GROUP = 'group'
+    DEFAULT_PERMISSIONS = 'default_permissions'
+    GROUP_PERMISSION = 'group_permission'
+    DONE = 'done'
+    STEPS = (CATEGORY, GROUP, DEFAULT_PERMISSIONS, GROUP_PERMISSION, DONE)
+    STEP_CHOICES = [(step, step) for step in STEPS]
+
+    course_key = CourseKeyField(max_length=255, unique=True)
+    display_name = models.TextField()
+    step = models.CharField(max_length=32, choices=STEP_CHOICES, default=CATEGORY, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_status_code = models.IntegerField(blank=True, null=True)
+    last_response = models.TextField(blank=True, default='')
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return '{}-{}'.format(str(self.course_key), self.step)
+
+
+class EdxNodeBBOutbox(models.Model):
+    """
+    Stores NodeBB sync operations within the edX transaction which raised them, until they are drained.
+
+    Operations whose prerequisites do not exist on NodeBB yet are held, waiting_for names the prerequisite.
+    """
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    HELD = 'held'
+    STATUS_CHOICES = [(status, status) for status in (PENDING, PROCESSING, DONE, FAILED, HELD)]
+
+    task_name = models.CharField(max_length=255)
+    args = models.TextField(default='[]')
+    kwargs = models.TextField(default='{}')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, blank=True, default='')
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    processed = models.DateTimeField(blank=True, null=True, db_index=True)
+    waiting_for = models.CharField(max_length=255, blank=True, default='', db_index=True)
+
+    class Meta(object):
+        index_together = [('status', 'available_at')]
+
+    def __str__(self):
+        return '{}-{}'.format(self.task_name.split('.')[-1], self.status)
+
+
+class EdxNodeBBDeadLetter(models.Model):
+    """
+    Stores NodeBB sync operations which ran out of retries, so that they can be replayed once NodeBB recovers.
+    """
+    task_name = models.CharField(max_length=255)
+    args = models.TextField(default='[]')
+    kwargs = models.TextField(default='{}')
+    status_code = models.IntegerField(blank=True, null=True)
+    response = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    replayed = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    def __str__(self):
+        return '{}-{}'.format(self.task_name.split('.')[-1], self.status_code)
@@ -0,0 +1,75 @@
+"""
+Benchmarks the pooled NodeBB client against a local stub server.
+
+Compares one connection per call (plain requests.request, the old behaviour) with the
+keep-alive session shared by Client. Run it from the edx-platform root directory:
+
+    python openedx/features/openedx_edly_discussion/scripts/benchmark_client.py --calls 1000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+from django.conf import settings as django_settings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from nodebb_stub import StubServer  # pylint: disable=wrong-import-position
+
+
+def configure(url, pool_maxsize):
+    django_settings.configure(
+        EDLY_DISCUSSION_SETTINGS={
+            'URL': url,
+            'CLIENT_POOL_MAXSIZE': pool_maxsize,
+        },
+        EDLY_DISCUSSION_SECRETS={
+            'API_MASTER_TOKEN': 'benchmark',
+        },
+        HIGH_PRIORITY_QUEUE='edx.core.high',
+        LOW_PRIORITY_QUEUE='edx.core.low',
+    )
+
+
+def run(label, server, calls, make_call):
+    connections_before = server.connections
+    started = time.time()
+    for index in range(calls):
+        make_call(index)
+    elapsed = time.time() - started
+
+    print('{:<10} {:>8} calls {:>8.3f}s {:>10.1f} calls/s {:>8} connections'.format(
+        label, calls, elapsed, calls / elapsed, server.connections - connections_before
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--pool-maxsize', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0, help='seconds the stub adds to every call')
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency).start()
+    configure(server.url, args.pool_maxsize)
+
+    from openedx.features.openedx_edly_discussion.client.client import Client, reset_session
+
+    client = Client()
+    response = requests.post(server.url + 'api/v2/users', data=json.dumps({'username': 'benchmark'})).json()
+    path = '/api/v2/users/{}'.format(response['payload']['uid'])
+    url, payload = server.url + path.lstrip('/'), json.dumps({'_uid': 1, 'fullname': 'Benchmark'})
+
+    try:
+        run('unpooled', server, args.calls, lambda index: requests.request('PUT', url, data=payload))
+        run('pooled', server, args.calls, lambda index: client.put(path, fullname='Benchmark'))
+    finally:
+        reset_session()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,428 @@
+"""
+Local stand-in for NodeBB, used to exercise and benchmark the client, tasks and sync commands offline.
+
+It keeps users, categories, groups, memberships and privileges in memory and implements the write
+api (/api/v2) and read api (/api) endpoints used by the client, with ETags on read calls.
+Latency and errors can be injected, and traffic can be recorded from a real NodeBB into a JSONL
+file and replayed later.
+
+    python scripts/nodebb_stub.py --port 4567 --latency 0.05 --error-rate 0.01
+    python scripts/nodebb_stub.py --port 4567 --upstream https://forum.example.com --record traffic.jsonl
+    python scripts/nodebb_stub.py --port 4567 --replay traffic.jsonl
+
+Point EDLY_DISCUSSION_SETTINGS['URL'] at the printed url to run the sync pipeline against it.
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import urljoin, urlsplit
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote, urljoin, urlsplit
+
+
+def slugify(name):
+    return re.sub(r'[^\w]+', '-', name.lower()).strip('-')
+
+
+class NodeBBState(object):
+    """
+    In memory users, categories and groups of the stub, guarded by one lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = {}
+        self.categories = {}
+        self.groups = {}
+        self.next_uid = 2
+        self.next_cid = 1
+
+    def create_user(self, data):
+        username = data.get('username')
+        if not username:
+            return 400, '[[error:invalid-username]]'
+        if any(user['username'] == username for user in self.users.values()):
+            return 400, '[[error:username-taken]]'
+
+        uid, self.next_uid = self.next_uid, self.next_uid + 1
+        self.users[uid] = {
+            'uid': uid,
+            'username': username,
+            'userslug': slugify(username),
+            'email': data.get('email'),
+            'joindate': data.get('joindate'),
+        }
+        return 200, {'uid': uid}
+
+    def update_user(self, uid, data):
+        user = self.users.get(int(uid))
+        if not user:
+            return 404, '[[error:no-user]]'
+
+        user.update((key, value) for key, value in data.items() if not key.startswith('_'))
+        return 200, {}
+
+    def delete_user(self, uid):
+        if self.users.pop(int(uid), None) is None:
+            return 404, '[[error:no-user]]'
+
+        for group in self.groups.values():
+            group['members'].discard(int(uid))
+        return 200, {}
+
+    def get_user(self, username):
+        for user in self.users.values():
+            if user['username'] == username:
+                return 200, user
+        return 404, '[[error:no-user]]'
+
+    def create_category(self, data):
+        cid, self.next_cid = self.next_cid, self.next_cid + 1
+        self.categories[cid] = {
+            'cid': cid,
+            'name': data.get('name'),
+            'description': data.get('description') or '',
+            'slug': '{}/{}'.format(cid, slugify(data.get('name') or '')),
+            'privileges': defaultdict(set),
+        }
+        return 200, self._category_data(cid)
+
+    def delete_category(self, cid):
+        if self.categories.pop(int(cid), None) is None:
+            return 404, '[[error:no-category]]'
+        return 200, {}
+
+    def change_privileges(self, cid, data, grant):
+        category = self.categories.get(int(cid))
+        if not category:
+            return 404, '[[error:no-category]]'
+
+        for group in data.get('groups') or []:
+            for privilege in data.get('privileges') or []:
+                if grant:
+                    category['privileges'][group].add(privilege)
+                else:
+                    category['privileges'][group].discard(privilege)
+        return 200, {}
+
+    def grant_privileges(self, cid, data):
+        return self.change_privileges(cid, data, grant=True)
+
+    def rescind_privileges(self, cid, data):
+        return self.change_privileges(cid, data, grant=False)
+
+    def _category_data(self, cid):
+        category = self.categories[cid]
+        data = dict((key, value) for key, value in category.items() if key != 'privileges')
+        data['privileges'] = dict(
+            (group, sorted(privileges)) for group, privileges in category['privileges'].items()
+        )
+        return data
+
+    def get_category(self, cid):
+        if int(cid) not in self.categories:
+            return 404, '[[error:no-category]]'
+        return 200, self._category_data(int(cid))
+
+    def get_categories(self):
+        return 200, {'categories': [self._category_data(cid) for cid in sorted(self.categories)]}
+
+    def create_group(self, data):
+        name = data.get('name')
+        slug = slugify(name or '')
+        if not slug:
+            return 400, '[[error:group-name-too-short]]'
+        if slug in self.groups:
+            return 400, '[[error:group-already-exists]]'
+
+        self.groups[slug] = {'name': name, 'slug': slug, 'members': set()}
+        return 200, self._group_data(slug)
+
+    def delete_group(self, slug):
+        if self.groups.pop(slug, None) is None:
+            return 404, '[[error:no-group]]'
+        return 200, {}
+
+    def change_membership(self, slug, uid, join):
+        group = self.groups.get(slug)
+        if not group:
+            return 404, '[[error:no-group]]'
+        if int(uid) not in self.users:
+            return 404, '[[error:no-user]]'
+
+        if join:
+            group['members'].add(int(uid))
+        else:
+            group['members'].discard(int(uid))
+        return 200, {}
+
+    def join_group(self, slug, uid):
+        return self.change_membership(slug, uid, join=True)
+
+    def leave_group(self, slug, uid):
+        return self.change_membership(slug, uid, join=False)
+
+    def _group_data(self, slug):
+        group = self.groups[slug]
+        return {'name': group['name'], 'slug': slug, 'memberCount': len(group['members'])}
+
+    def get_group(self, slug):
+        if slug not in self.groups:
+            return 404, '[[error:no-group]]'
+        return 200, {'group': self._group_data(slug)}
+
+    def get_members(self, slug):
+        if slug not in self.groups:
+            return 404, '[[error:no-group]]'
+        members = [self.users[uid] for uid in sorted(self.groups[slug]['members']) if uid in self.users]
+        return 200, {'users': members}
+
+
+ROUTES = [
+    ('POST', r'^/api/v2/users$', 'create_user', True),
+    ('PUT', r'^/api/v2/users/(\d+)$', 'update_user', True),
+    ('DELETE', r'^/api/v2/users/(\d+)$', 'delete_user', False),
+    ('POST', r'^/api/v2/categories$', 'create_category', True),
+    ('DELETE', r'^/api/v2/categories/(\d+)$', 'delete_category', False),
+    ('PUT', r'^/api/v2/categories/(\d+)/privileges$', 'grant_privileges', True),
+    ('DELETE', r'^/api/v2/categories/(\d+)/privileges$', 'rescind_privileges', True),
+    ('POST', r'^/api/v2/groups$', 'create_group', True),
+    ('DELETE', r'^/api/v2/groups/([^/]+)$', 'delete_group', False),
+    ('PUT', r'^/api/v2/groups/([^/]+)/membership/(\d+)$', 'join_group', False),
+    ('DELETE', r'^/api/v2/groups/([^/]+)/membership/(\d+)$', 'leave_group', False),
+    ('GET', r'^/api/user/username/([^/]+)$', 'get_user', False),
+    ('GET', r'^/api/categories$', 'get_categories', False),
+    ('GET', r'^/api/category/(\d+)(?:/[^/]*)?$', 'get_category', False),
+    ('GET', r'^/api/groups/([^/]+)$', 'get_group', False),
+    ('GET', r'^/api/groups/([^/]+)/members$', 'get_members', False),
+]
+ROUTES = [(method, re.compile(pattern), action, with_body) for method, pattern, action, with_body in ROUTES]
+FORWARDED_HEADERS = ('Authorization', 'Content-Type', 'If-None-Match')
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the NodeBB endpoints used by the client over keep-alive connections.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.count_connection()
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _write(self, status_code, body, headers=None):
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method, path, data):
+        state = self.server.state
+        for route_method, pattern, action, with_body in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                args = match.groups() + ((data,) if with_body else ())
+                with state.lock:
+                    return getattr(state, action)(*args)
+        return 404, '[[error:no-route]]'
+
+    def _respond(self):
+        method, path = self.command, unquote(urlsplit(self.path).path)
+        raw_body = self._read_body()
+        server = self.server
+
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        if server.error_rate and random.random() < server.error_rate:
+            body = json.dumps({'code': 'error', 'message': 'injected'}).encode('utf-8')
+            return self._write(server.error_status, body)
+
+        if server.replay is not None:
+            status_code, body = server.replay_response(method, path)
+            return self._write(status_code, body)
+
+        if server.upstream:
+            status_code, body = server.forward(method, self.path, raw_body, self.headers)
+            server.record(method, path, raw_body, status_code, body)
+            return self._write(status_code, body)
+
+        try:
+            data = json.loads(raw_body.decode('utf-8')) if raw_body else {}
+        except ValueError:
+            data = {}
+
+        status_code, response = self._dispatch(method, path, data)
+        if method == 'GET':
+            body = json.dumps(response if status_code == 200 else {'message': response}).encode('utf-8')
+            etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+            if status_code == 200 and self.headers.get('If-None-Match') == etag:
+                return self._write(304, b'', {'ETag': etag})
+            return self._write(status_code, body, {'ETag': etag} if status_code == 200 else None)
+
+        if status_code == 200:
+            body = {'code': 'ok', 'payload': response}
+        else:
+            body = {'code': 'bad-request' if status_code == 400 else 'not-found', 'message': response, 'params': {}}
+        self._write(status_code, json.dumps(body).encode('utf-8'))
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded NodeBB stub server that counts accepted connections.
+
+    Args:
+        address (tuple): (host, port) to listen on, port 0 picks a free port.
+        latency (float): Seconds added to every call.
+        jitter (float): Upper bound of random seconds added on top of latency.
+        error_rate (float): Share of calls answered with error_status.
+        error_status (int): Status code of injected errors.
+        upstream (str): Url of a real NodeBB to forward calls to, required for recording.
+        record_path (str): JSONL file receiving the forwarded traffic.
+        replay_path (str): JSONL file of recorded traffic to answer from.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), handler_class=StubRequestHandler, latency=0, jitter=0,
+                 error_rate=0, error_status=500, upstream=None, record_path=None, replay_path=None, verbose=False):
+        HTTPServer.__init__(self, address, handler_class)
+        self.state = NodeBBState()
+        self.connections = 0
+        self.latency, self.jitter = latency, jitter
+        self.error_rate, self.error_status = error_rate, error_status
+        self.upstream, self.verbose = upstream, verbose
+        self._lock = threading.Lock()
+        self._record_file = open(record_path, 'a') if record_path else None
+        self.replay = self._load_replay(replay_path) if replay_path else None
+
+    @property
+    def url(self):
+        return 'http://{}:{}/'.format(*self.server_address)
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    @staticmethod
+    def _load_replay(replay_path):
+        replay = defaultdict(deque)
+        with open(replay_path) as replay_file:
+            for line in replay_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    replay[(entry['method'], entry['path'])].append(entry)
+        return replay
+
+    def replay_response(self, method, path):
+        """
+        Answers with the next recorded response of the same call, the last one is repeated once exhausted.
+        """
+        with self._lock:
+            entries = self.replay.get((method, path))
+            if not entries:
+                return 404, json.dumps({'code': 'not-found', 'message': 'not recorded'}).encode('utf-8')
+            entry = entries.popleft() if len(entries) > 1 else entries[0]
+        return entry['status'], entry['response'].encode('utf-8')
+
+    def forward(self, method, path, raw_body, headers):
+        import requests
+
+        forwarded_headers = dict(
+            (name, headers.get(name)) for name in FORWARDED_HEADERS if headers.get(name)
+        )
+        try:
+            response = requests.request(
+                method, urljoin(self.upstream, path), data=raw_body, headers=forwarded_headers
+            )
+        except requests.exceptions.RequestException as err:
+            return 502, json.dumps({'code': 'error', 'message': str(err)}).encode('utf-8')
+        return response.status_code, response.content
+
+    def record(self, method, path, raw_body, status_code, body):
+        if not self._record_file:
+            return
+
+        entry = {
+            'time': time.time(),
+            'method': method,
+            'path': path,
+            'request': raw_body.decode('utf-8'),
+            'status': status_code,
+            'response': body.decode('utf-8'),
+        }
+        with self._lock:
+            self._record_file.write(json.dumps(entry) + '\n')
+            self._record_file.flush()
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._record_file:
+            self._record_file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4567)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every call')
+    parser.add_argument('--jitter', type=float, default=0, help='random seconds added on top of latency')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of calls answered with an error')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--upstream', help='url of a real NodeBB to forward calls to')
+    parser.add_argument('--record', help='JSONL file receiving the forwarded traffic, needs --upstream')
+    parser.add_argument('--replay', help='JSONL file of recorded traffic to answer from')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.record and not args.upstream:
+        parser.error('--record needs --upstream')
+
+    server = StubServer(
+        (args.host, args.port), latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        error_status=args.error_status, upstream=args.upstream, record_path=args.record, replay_path=args.replay,
+        verbose=args.verbose
+    )
+    print('NodeBB stub listening on {}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,7 @@ from django.shortcuts import render_to_response
 from django.views.generic import TemplateView
 from django_comment_client.utils import has_discussion_privileges
 from opaque_keys.edx.keys import CourseKey
-from openedx.features.openedx_edly_discussion.client.utils import get_category_id_from_course_id
+from openedx.features.openedx_edly_discussion.client.utils import CourseMapping
 from student.models import CourseEnrollment
 
 
@@ -22,7 +22,7 @@ class EdlyDiscussionDashboardView(TemplateView):
         """
         course_key = CourseKey.from_string(course_id)
         course = get_course_with_access(request.user, 'load', course_key)
-        category_id = get_category_id_from_course_id(course_key)
+        course_mapping = CourseMapping.load(course_id=course_key)
         if not CourseEnrollment.is_enrolled(request.user, course.id) and \
                 not has_access(request.user, 'staff', course, course.id):
             raise Http404
@@ -31,7 +31,7 @@ class EdlyDiscussionDashboardView(TemplateView):
         context = {
             'course': course,
             'edly_discussion_url': django_settings.EDLY_DISCUSSION_SETTINGS['URL'],
-            'category_id': category_id,
+            'category_id': course_mapping.cid if course_mapping else None,
             'user_info': {
                 'username': user.username,
                 'privileged': has_discussion_privileges(user, course_key),